@@ -0,0 +1,211 @@
+# bench.py
+"""
+Офлайн-бенчмарк пути «коллекция вышла → SendStarsFormRequest отправлен».
+
+Поднимает fake_stickerdom.FakeStickerDom на localhost, подменяет клиент
+Telegram на fake_telegram.FakeTelegramClient и гоняет настоящий
+sticker_monitor.monitor() + purchase_planner по сценарию из
+нескольких выходов коллекций. В конце печатает p50/p99 задержки,
+число запросов на один выход и процессорное время на один опрос.
+
+    python bench.py --drops 20 --interval 0.25 --latency 0.02 --rtt 0.05
+
+Реальные файлы состояния (bearer_token.txt, state.db) не трогаются:
+бенчмарк работает во временной папке.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import functools
+import io
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import detection
+import http_transport
+import pipeline
+import purchase_planner
+import state_store
+import sticker_monitor
+import tg_session
+import token_manager
+from fake_stickerdom import FakeStickerDom, Scenario, fake_jwt
+from fake_telegram import FakeTelegramClient
+from poll_scheduler import AdaptiveScheduler, FixedScheduler
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile; NaN for an empty list."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def _isolate_state(workdir: Path, first_id: int) -> None:
+    """Point every state file at *workdir* so the real ones stay untouched."""
+    token_manager.TOKEN_TXT = workdir / "bearer_token.txt"
+    token_manager.TOKEN_TXT.write_text(fake_jwt())
+    state_store.open_store(str(workdir / "state.db")).set_last_id(first_id - 1)
+
+
+async def run_bench(args) -> dict:
+    workdir = Path(tempfile.mkdtemp(prefix="stickers-bench-"))
+    first_id = 1000
+    _isolate_state(workdir, first_id)
+
+    scenario = Scenario(
+        latency=args.latency,
+        slow_ratio=args.slow_ratio,
+        slow_latency=args.slow_latency,
+        rate_limit_every=args.rate_limit_every,
+        hidden=set(range(first_id, first_id + args.drops * 2, args.gap_every)) if args.gap_every else None,
+    )
+    server = FakeStickerDom(scenario)
+    await server.start()
+    http_transport.ENDPOINTS.update(server.endpoints())
+
+    send_errors = args.send_errors.split(",") if args.send_errors else None
+    client = FakeTelegramClient(rtt=args.rtt, send_errors=send_errors)
+    tg_session.use_client(client)
+    await pipeline.prewarm()
+
+    # Each drop gets its own ID; hidden IDs are skipped over (look-ahead test).
+    visible = [i for i in range(first_id, first_id + args.drops * 2) if i not in scenario.hidden][:args.drops]
+    start = time.monotonic() + 1.0
+    loop = asyncio.get_running_loop()
+    for n, collection_id in enumerate(visible):
+        at = start + n * args.spacing + random.uniform(0, args.spacing / 2)
+        scenario.release(collection_id, at)
+        if args.push:
+            # The announcement arrives through Telegram shortly after the release.
+            announce = functools.partial(client.announce, f"New collection {collection_id} is out!")
+            loop.call_at(at + args.push_delay, lambda a=announce: asyncio.ensure_future(a()))
+
+    purchase_planner.PURCHASE_CHARACTERS = [int(c) for c in args.characters.split(",")]
+    budget = purchase_planner.StarsBudget(args.budget)
+    detected: dict[int, float] = {}
+    purchases: set[asyncio.Task] = set()
+
+    async def on_found(collection_id: int, detected_at: float) -> None:
+        detected[collection_id] = detected_at
+        task = asyncio.create_task(
+            purchase_planner.purchase_collection(collection_id, args.attempts, detected_at, budget)
+        )
+        purchases.add(task)
+        task.add_done_callback(purchases.discard)
+
+    if args.scheduler == "adaptive":
+        scheduler = AdaptiveScheduler()
+    else:
+        scheduler = FixedScheduler(args.interval)
+
+    counts_before = sum(server.counts.values()) - server.counts["root"]
+    cpu_before = time.process_time()
+    if args.push:
+        monitor = asyncio.create_task(detection.detect(on_found, scheduler, push=True))
+    else:
+        monitor = asyncio.create_task(sticker_monitor.monitor(on_found, scheduler))
+
+    deadline = start + args.drops * args.spacing + args.timeout
+    first_send: dict[int, float] = {}
+    last_send: dict[int, float] = {}
+    while len(first_send) < len(visible) and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+        for sent_at, slug in client.sent:
+            collection_id = int(slug.split("-")[0][1:])
+            first_send.setdefault(collection_id, sent_at)
+            last_send[collection_id] = max(sent_at, last_send.get(collection_id, 0))
+    # Give the other characters of the last drop a moment to finish.
+    while purchases and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    for sent_at, slug in client.sent:
+        collection_id = int(slug.split("-")[0][1:])
+        last_send[collection_id] = max(sent_at, last_send.get(collection_id, 0))
+
+    monitor.cancel()
+    for task in list(purchases):
+        task.cancel()
+    await asyncio.gather(monitor, *purchases, return_exceptions=True)
+    cpu = time.process_time() - cpu_before
+    requests = sum(server.counts.values()) - server.counts["root"] - counts_before
+
+    await tg_session.close_client()
+    await http_transport.close_transport()
+    await server.stop()
+
+    release_to_send = [first_send[c] - scenario.releases[c] for c in first_send]
+    detect_to_send = [first_send[c] - detected[c] for c in first_send if c in detected]
+    detect_to_last = [last_send[c] - detected[c] for c in last_send if c in detected]
+    return {
+        "drops": len(visible),
+        "bought": len(first_send),
+        "release_to_send": release_to_send,
+        "detect_to_send": detect_to_send,
+        "detect_to_last": detect_to_last,
+        "sends": len(client.sent),
+        "spent": budget.spent,
+        "requests": requests,
+        "polls": server.counts["collection"],
+        "rate_limited": server.counts["429"],
+        "not_modified": server.counts["304"],
+        "cpu": cpu,
+    }
+
+
+def report(result: dict) -> None:
+    ms = lambda v: f"{v * 1000:8.1f} ms"
+    drops = max(1, result["drops"])
+    print("--- StickerDom offline benchmark ---")
+    print(f"drops purchased        : {result['bought']}/{result['drops']}")
+    for key, title in (
+        ("release_to_send", "release → send"),
+        ("detect_to_send", "detect  → send"),
+        ("detect_to_last", "detect  → last"),
+    ):
+        values = result[key]
+        print(f"{title} p50     : {ms(percentile(values, 50))}")
+        print(f"{title} p99     : {ms(percentile(values, 99))}")
+    print(f"SendStars calls        : {result['sends']} ({result['spent']} ⭐ spent)")
+    print(f"requests per drop      : {result['requests'] / drops:8.1f}")
+    print(f"collection polls       : {result['polls']} ({result['rate_limited']} answered 429, "
+          f"{result['not_modified']} answered 304)")
+    # The fake server runs in this process, so its CPU time is included.
+    print(f"CPU per poll           : {result['cpu'] / max(1, result['polls']) * 1000:8.3f} ms (client + fake server)")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Offline detect-to-purchase benchmark.")
+    parser.add_argument("--drops", type=int, default=10, help="number of collections to release")
+    parser.add_argument("--spacing", type=float, default=2.0, help="seconds between releases")
+    parser.add_argument("--attempts", type=int, default=1, help="purchase attempts per character")
+    parser.add_argument("--characters", default="2", help="comma-separated character IDs, by priority")
+    parser.add_argument("--budget", type=int, default=None, help="Stars budget (default: no limit)")
+    parser.add_argument("--scheduler", choices=("fixed", "adaptive"), default="fixed")
+    parser.add_argument("--interval", type=float, default=0.25, help="poll interval of the fixed scheduler")
+    parser.add_argument("--latency", type=float, default=0.02, help="fake API latency, seconds")
+    parser.add_argument("--slow-ratio", type=float, default=0.0, help="share of slow API responses")
+    parser.add_argument("--slow-latency", type=float, default=1.0, help="extra delay of a slow response")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="answer every N-th poll with 429")
+    parser.add_argument("--gap-every", type=int, default=0, help="hide every N-th collection ID")
+    parser.add_argument("--rtt", type=float, default=0.05, help="fake MTProto round-trip, seconds")
+    parser.add_argument("--send-errors", default="", help="comma-separated RPC errors for SendStars, e.g. FORM_EXPIRED,FLOOD_WAIT_1")
+    parser.add_argument("--push", action="store_true", help="also announce drops via fake Telegram messages")
+    parser.add_argument("--push-delay", type=float, default=0.05, help="seconds from release to announcement")
+    parser.add_argument("--timeout", type=float, default=15.0, help="extra seconds to wait for purchases")
+    parser.add_argument("--verbose", action="store_true", help="show the monitor's own output")
+    args = parser.parse_args(argv)
+
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        result = asyncio.run(run_bench(args))
+    report(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# collection_cache.py
+"""
+Кэш метаданных коллекций в памяти.
+
+Для каждого ID хранит последний статус ответа, разобранный payload
+(персонажи, цены, остаток) и валидаторы ``ETag`` / ``Last-Modified``.
+Монитор отправляет их обратно как ``If-None-Match`` /
+``If-Modified-Since``: если сервер ответил 304, тело не скачивается и не
+разбирается заново, а берётся из кэша. Путь покупки читает payload
+отсюда (или из state.db), не делая лишнего запроса.
+"""
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+
+from http_transport import HttpResponse
+from params import COLLECTION_CACHE_SIZE
+from state_store import get_store
+
+
+class CachedCollection:
+    """Last known answer for one collection ID."""
+
+    __slots__ = ("status", "data", "etag", "last_modified", "fetched_at")
+
+    def __init__(self, status: int, data, etag: str | None, last_modified: str | None) -> None:
+        self.status = status
+        self.data = data                  # full parsed body, {"ok": ..., "data": {...}}
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = time.time()
+
+    @property
+    def payload(self) -> dict | None:
+        """The collection itself ("data" of a live answer), if any."""
+        if self.status == 200 and isinstance(self.data, dict):
+            return self.data.get("data")
+        return None
+
+
+class CollectionCache:
+    """LRU of CachedCollection entries keyed by collection ID."""
+
+    def __init__(self, max_entries: int = COLLECTION_CACHE_SIZE) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[int, CachedCollection] = OrderedDict()
+
+    def get(self, collection_id: int) -> CachedCollection | None:
+        entry = self._entries.get(collection_id)
+        if entry is not None:
+            self._entries.move_to_end(collection_id)
+        return entry
+
+    def validators(self, collection_id: int) -> dict:
+        """Keyword arguments for StickerDomTransport.get_collection()."""
+        entry = self._entries.get(collection_id)
+        if entry is None:
+            return {}
+        return {"etag": entry.etag, "last_modified": entry.last_modified}
+
+    def store(self, collection_id: int, response: HttpResponse, data) -> None:
+        """Remember a 200, or any answer the server gave validators for."""
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if response.status != 200 and not (etag or last_modified):
+            self._entries.pop(collection_id, None)
+            return
+        self._entries[collection_id] = CachedCollection(response.status, data, etag, last_modified)
+        self._entries.move_to_end(collection_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def payload(self, collection_id: int) -> dict | None:
+        """Cached collection payload, falling back to the one journaled in state.db."""
+        entry = self.get(collection_id)
+        if entry is not None and entry.payload is not None:
+            return entry.payload
+        return get_store().collection_payload(collection_id)
+
+
+_cache: CollectionCache | None = None
+
+
+def get_collection_cache() -> CollectionCache:
+    """Return the process-wide cache."""
+    global _cache
+    if _cache is None:
+        _cache = CollectionCache()
+    return _cache
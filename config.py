@@ -13,4 +13,4 @@ API_HASH = "123"  # 👈 Замените на ваш API HASH
 # Имя файла для хранения сессии Telegram. Должно быть одинаковым для всех скриптов.
 SESSION_NAME = "telegram_session" 
 
-CHARACTER_ID = 2
\ No newline at end of file
+# Все остальные настройки (персонажи, интервалы, бюджет) — в params.py.
\ No newline at end of file
@@ -0,0 +1,136 @@
+# daemon.py
+"""
+Единый процесс: обновление токена, обнаружение коллекций (опрос API и
+анонсы в Telegram, см. detection.py), отслеживание известных коллекций
+(watchlist.py) и покупка.
+
+Все три части работают как задачи одного event loop и делят один
+клиент Telegram (сессия в памяти, см. tg_session.py) и один HTTP-пул.
+Запуск:
+
+    python daemon.py            # или: python stickers.py daemon
+    python stickers.py standby --at 18:00
+
+В режиме ожидания (standby) процесс заранее импортирует всё нужное, а за
+``STANDBY_LEAD_SECONDS`` до выхода подключается, прогревается и при
+необходимости обновляет токен.
+
+Остановка — Ctrl + C или SIGTERM: задачи отменяются, сессия Telegram
+сохраняется на диск, соединения закрываются.
+"""
+from __future__ import annotations
+
+import asyncio
+import signal
+import time
+
+import detection
+import metrics
+import notifier
+import sticker_monitor
+import token_manager
+import watchlist
+from http_transport import close_transport
+from params import STANDBY_HOLD_SECONDS, STANDBY_LEAD_SECONDS, TOKEN_REFRESH_MARGIN
+from pipeline import prewarm
+from tg_session import check_config, close_client
+
+
+async def purchaser(queue: asyncio.Queue) -> None:
+    """Buy every collection the monitor puts into *queue*, one at a time."""
+    while True:
+        collection_id, detected_at = await queue.get()
+        try:
+            await sticker_monitor.purchase_collection(collection_id, detected_at)
+        finally:
+            queue.task_done()
+
+
+async def refresh_token_before(drop_at: float) -> None:
+    """Refresh now if the scheduled refresh would land around the drop at *drop_at*."""
+    try:
+        token_manager.get_bearer()
+        expires_at = token_manager.token_expires_at()
+    except RuntimeError:
+        expires_at = 0.0  # no token yet
+    if expires_at is not None and expires_at - TOKEN_REFRESH_MARGIN < drop_at + STANDBY_HOLD_SECONDS:
+        print("🔑 Refreshing the token ahead of the drop...")
+        try:
+            await token_manager.refresh_bearer()
+        except RuntimeError as exc:
+            print(f"⚠️  {exc}")
+
+
+async def run(drop_at: float | None = None) -> None:
+    """
+    Start all tasks and supervise them until a signal or a crash.
+
+    With *drop_at* (Unix time) the daemon stands by: it sleeps until
+    STANDBY_LEAD_SECONDS before the drop, then connects, warms up and
+    refreshes the token so that nothing cold is left for the drop itself.
+    """
+    if not check_config():
+        return
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C arrives as KeyboardInterrupt instead
+
+    if drop_at is not None:
+        wake_at = drop_at - STANDBY_LEAD_SECONDS
+        print(f"💤 Standing by until {time.strftime('%H:%M:%S', time.localtime(wake_at))} "
+              f"(drop at {time.strftime('%H:%M:%S', time.localtime(drop_at))})")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=max(0.0, wake_at - time.time()))
+            return  # stopped while standing by
+        except asyncio.TimeoutError:
+            pass
+
+    print("--- StickerDom daemon started ---")
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def on_found(collection_id: int, detected_at: float) -> None:
+        queue.put_nowait((collection_id, detected_at))
+
+    tasks: list[asyncio.Task] = []
+    stopper = loop.create_task(stop.wait(), name="stop")
+    try:
+        # Inside the try: a failed connect or warm-up still closes the clients.
+        await prewarm()
+        if drop_at is not None:
+            await refresh_token_before(drop_at)
+        tasks = [
+            token_manager.start_background_refresh(loop),
+            loop.create_task(detection.detect(on_found), name="detection"),
+            loop.create_task(watchlist.Watchlist(on_found).run(), name="watchlist"),
+            loop.create_task(purchaser(queue), name="purchaser"),
+            loop.create_task(metrics.flush_loop(), name="metrics"),
+            loop.create_task(notifier.get_notifier().run(), name="notifier"),
+        ]
+        done, _ = await asyncio.wait([*tasks, stopper], return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task is not stopper and not task.cancelled() and task.exception():
+                print(f"🚨 Task {task.get_name()} crashed: {task.exception()!r}")
+    finally:
+        print("Stopping...")
+        for task in (*tasks, stopper):
+            task.cancel()
+        await asyncio.gather(*tasks, stopper, return_exceptions=True)
+        await close_client()  # also saves the Telegram session to disk
+        await close_transport()
+        print("--- StickerDom daemon stopped ---")
+
+
+def main(drop_at: float | None = None) -> None:
+    try:
+        asyncio.run(run(drop_at))
+    except KeyboardInterrupt:
+        print("\n--- StickerDom daemon stopped ---")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+# detection.py
+"""
+Источники обнаружения новых коллекций.
+
+* ``PollingSource`` — прежний опрос ``BASE_URL`` (sticker_monitor.monitor).
+* ``TelegramPushSource`` — обработчик событий Telethon: читает новые
+  сообщения бота магазина или канала с анонсами (``PUSH_CHATS``) и
+  достаёт из текста и ссылок ID коллекции. ID из сообщения сначала
+  проверяется запросом к API и уходит в покупку, только когда коллекция
+  действительно вышла. ID дальше ``LOOKAHEAD_WINDOW`` от последнего
+  найденного игнорируются, а перескочённые ID записываются как
+  пропущенные — так же, как при заглядывании вперёд в опросе.
+
+``Detector`` запускает оба источника и отсеивает повторы. Опрос
+становится редким (не чаще ``PUSH_BACKSTOP_INTERVAL``), только когда push
+опередил его на последних ``PUSH_TRUST_DROPS`` выходах и обновления
+Telegram продолжают приходить; стоит опросу найти выход первым или push
+замолчать — опрос возвращается к обычному расписанию.
+"""
+from __future__ import annotations
+
+import asyncio
+import re
+import time
+from collections import deque
+
+from telethon import events
+
+import sticker_monitor
+from collection_cache import get_collection_cache
+from http_transport import TransportError, get_transport
+from params import (
+    LOOKAHEAD_WINDOW,
+    PUSH_BACKSTOP_INTERVAL,
+    PUSH_CHATS,
+    PUSH_ENABLED,
+    PUSH_ID_PATTERN,
+    PUSH_PROBE_INTERVAL,
+    PUSH_PROBE_SECONDS,
+    PUSH_QUIET_SECONDS,
+    PUSH_TRUST_DROPS,
+)
+from poll_scheduler import PollScheduler, make_scheduler
+from state_store import get_store
+from tg_session import get_client
+
+
+class DetectionSource:
+    """Base class: reports new collection IDs through *emit*."""
+
+    name = "source"
+
+    async def run(self, emit) -> None:
+        """Run forever, awaiting ``emit(collection_id, detected_at, self)`` for every find."""
+        raise NotImplementedError
+
+
+class PollingSource(DetectionSource):
+    """HTTP polling of BASE_URL via sticker_monitor.monitor()."""
+
+    name = "poll"
+
+    def __init__(self, scheduler: PollScheduler | None = None) -> None:
+        self.scheduler = scheduler or make_scheduler()
+
+    async def run(self, emit) -> None:
+        async def on_found(collection_id: int, detected_at: float) -> None:
+            await emit(collection_id, detected_at, self)
+
+        await sticker_monitor.monitor(on_found, self.scheduler)
+
+
+class TelegramPushSource(DetectionSource):
+    """Collection IDs parsed from new messages in PUSH_CHATS."""
+
+    name = "push"
+
+    def __init__(self, chats=PUSH_CHATS, pattern: str = PUSH_ID_PATTERN) -> None:
+        self.chats = list(chats)
+        self.pattern = re.compile(pattern, re.IGNORECASE)
+        self.last_update = 0.0
+        self.connected = False
+        # Which source reported each recent drop first: True if push did.
+        self.races: deque[bool] = deque(maxlen=PUSH_TRUST_DROPS)
+        self._emit = None
+
+    def healthy(self) -> bool:
+        """
+        True while push can be relied on: connected, not silent, and first
+        on each of the last PUSH_TRUST_DROPS drops. Other Telegram traffic
+        alone proves nothing about the announcements.
+        """
+        return (
+            self.connected
+            and time.monotonic() - self.last_update < PUSH_QUIET_SECONDS
+            and len(self.races) == self.races.maxlen
+            and all(self.races)
+        )
+
+    def record_race(self, push_won: bool) -> None:
+        was_healthy = self.healthy()
+        self.races.append(push_won)
+        if was_healthy and not push_won:
+            print("📡 Polling found a drop before push; polling at the normal rate")
+
+    async def run(self, emit) -> None:
+        self._emit = emit
+        client = await get_client()
+        new_message = events.NewMessage(chats=self.chats)
+        client.add_event_handler(self._on_update, events.Raw)
+        client.add_event_handler(self._on_message, new_message)
+        self.connected = True
+        self.last_update = time.monotonic()
+        print(f"📡 Listening for new collections in {', '.join(map(str, self.chats))}")
+        try:
+            while True:
+                was_healthy = self.healthy()
+                await asyncio.sleep(PUSH_QUIET_SECONDS / 2)
+                self.connected = client.is_connected()
+                if was_healthy and not self.healthy():
+                    print("📡 Push updates are quiet; polling at the normal rate")
+        finally:
+            self.connected = False
+            client.remove_event_handler(self._on_message, new_message)
+            client.remove_event_handler(self._on_update, events.Raw)
+
+    async def _on_update(self, update) -> None:
+        self.last_update = time.monotonic()
+        self.connected = True
+
+    async def _on_message(self, event) -> None:
+        detected_at = time.monotonic()
+        for collection_id in self.collection_ids(event):
+            await self._emit(collection_id, detected_at, self)
+
+    def collection_ids(self, event) -> list[int]:
+        """Collection IDs mentioned in the message text, its links and its buttons."""
+        texts = [event.raw_text or ""]
+        message = event.message
+        for entity in getattr(message, "entities", None) or ():
+            url = getattr(entity, "url", None)
+            if url:
+                texts.append(url)
+        markup = getattr(message, "reply_markup", None)
+        for row in getattr(markup, "rows", None) or ():
+            for button in row.buttons:
+                url = getattr(button, "url", None)
+                if url:
+                    texts.append(url)
+        ids = []
+        for text in texts:
+            for match in self.pattern.finditer(text):
+                collection_id = int(match.group(1))
+                if collection_id not in ids:
+                    ids.append(collection_id)
+        return ids
+
+
+class PushAwareScheduler(PollScheduler):
+    """Polls no more often than PUSH_BACKSTOP_INTERVAL while push is trusted."""
+
+    def __init__(self, inner: PollScheduler, push: TelegramPushSource) -> None:
+        self.inner = inner
+        self.push = push
+
+    def next_delay(self, status: int | None, headers=None) -> float:
+        delay = self.inner.next_delay(status, headers)
+        if self.push.healthy():
+            return max(delay, PUSH_BACKSTOP_INTERVAL)
+        return delay
+
+    def record_drop(self, timestamp: float) -> None:
+        self.inner.record_drop(timestamp)
+
+
+class Detector:
+    """Runs the detection sources and forwards each collection ID once."""
+
+    def __init__(self, on_found, sources: list[DetectionSource]) -> None:
+        self.on_found = on_found
+        self.sources = sources
+        self._confirming: dict[int, asyncio.Task] = {}
+        self.seen: set[int] = set()
+
+    async def emit(self, collection_id: int, detected_at: float, source: DetectionSource) -> None:
+        if collection_id in self.seen:
+            return
+        if source.name != "push":
+            self._record_race(push_won=False)
+        if source.name == "push":
+            if self.is_old(collection_id) or collection_id in self._confirming:
+                return  # an old collection mentioned again, or already being probed
+            last_id = get_store().get_last_id()
+            if last_id is not None and collection_id > last_id + LOOKAHEAD_WINDOW:
+                print(f"📡 Ignoring collection {collection_id} from a message: too far past {last_id}")
+                return
+            print(f"📡 Push: collection {collection_id} mentioned; checking the API")
+            # A regex match is not a drop: buy only what the API actually serves
+            # (this also gives the planner the prices it needs).
+            task = asyncio.create_task(self._confirm(collection_id, detected_at, source))
+            self._confirming[collection_id] = task
+            task.add_done_callback(lambda _, cid=collection_id: self._confirming.pop(cid, None))
+            return
+        await self._claim(collection_id, detected_at, source)
+
+    @staticmethod
+    def is_old(collection_id: int) -> bool:
+        """
+        True for IDs the poller is already past (receipts, "sold out" notices).
+
+        The collections table does not cover everything: it starts empty after
+        the last_sticker_id.txt migration and never sees collections bought
+        elsewhere. IDs the poller skipped over are still new.
+        """
+        store = get_store()
+        if store.is_seen(collection_id):
+            return True
+        last_id = store.get_last_id()
+        return last_id is not None and collection_id <= last_id and not store.is_skipped(collection_id)
+
+    async def _claim(self, collection_id: int, detected_at: float, source: DetectionSource) -> None:
+        # Claim the ID before any await so the other source cannot report it too.
+        self.seen.add(collection_id)
+        if source.name == "push":
+            store = get_store()
+            last_id = store.get_last_id() or 0
+            # Like the poller's look-ahead: IDs jumped over are recorded as skipped.
+            skipped = [i for i in range(last_id + 1, collection_id) if not store.is_seen(i)]
+            if skipped:
+                store.record_skipped(skipped)
+            store.mark_seen(collection_id, get_collection_cache().payload(collection_id))
+            for polling in self.sources:
+                if isinstance(polling, PollingSource):
+                    polling.scheduler.record_drop(time.time())
+            self._record_race(push_won=True)
+            print(f"📡 Push: new collection {collection_id}")
+        await self.on_found(collection_id, detected_at)
+
+    def _record_race(self, push_won: bool) -> None:
+        for push in self.sources:
+            if isinstance(push, TelegramPushSource):
+                push.record_race(push_won)
+
+    async def _confirm(self, collection_id: int, detected_at: float, source: DetectionSource) -> None:
+        """Probe a pushed ID until the API serves it; if it never does, the poller keeps it."""
+        deadline = time.monotonic() + PUSH_PROBE_SECONDS
+        while collection_id not in self.seen:
+            try:
+                response, data = await sticker_monitor.probe(get_transport(), collection_id)
+            except (*TransportError, RuntimeError) as exc:
+                print(f"⚠️  Could not fetch collection {collection_id}: {exc}")
+            else:
+                if sticker_monitor.is_live(response, data):
+                    if collection_id not in self.seen:
+                        await self._claim(collection_id, detected_at, source)
+                    return
+            if time.monotonic() >= deadline:
+                print(f"📡 Collection {collection_id} is not served by the API yet; leaving it to polling")
+                return
+            await asyncio.sleep(PUSH_PROBE_INTERVAL)
+
+    async def _run_source(self, source: DetectionSource) -> None:
+        try:
+            await source.run(self.emit)
+        except Exception as exc:
+            if isinstance(source, PollingSource):
+                raise
+            print(f"⚠️  Detection source {source.name} stopped ({exc!r}); polling continues")
+
+    async def run(self) -> None:
+        tasks = [asyncio.create_task(self._run_source(source), name=source.name) for source in self.sources]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()  # re-raise the crash
+        finally:
+            confirming = list(self._confirming.values())
+            for task in (*tasks, *confirming):
+                task.cancel()
+            await asyncio.gather(*tasks, *confirming, return_exceptions=True)
+
+
+async def detect(on_found, scheduler: PollScheduler | None = None, push: bool = PUSH_ENABLED) -> None:
+    """
+    Detect new collections with polling and, if *push* is on, Telegram
+    announcements; awaits ``on_found(collection_id, detected_at)`` once per ID.
+    """
+    scheduler = scheduler or make_scheduler()
+    sources: list[DetectionSource] = []
+    if push:
+        push_source = TelegramPushSource()
+        sources.append(push_source)
+        scheduler = PushAwareScheduler(scheduler, push_source)
+    sources.append(PollingSource(scheduler))
+    await Detector(on_found, sources).run()
@@ -0,0 +1,200 @@
+# fake_stickerdom.py
+"""
+Локальная подделка API StickerDom для бенчмарков и отладки.
+
+Отдаёт ``/api/v1/collection/<id>``, ``/api/v1/shop/buy`` и
+``/api/v1/auth`` по сценарию: какие коллекции и когда «выходят»,
+какие ID пропущены, как часто отвечать 429 и с какой задержкой.
+
+Запуск отдельно (коллекция 1001 появится через 10 секунд):
+
+    python fake_stickerdom.py --port 8080 --first-id 1001 --drop-after 10
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+
+class Scenario:
+    """Script for the fake server; all times are seconds of time.monotonic()."""
+
+    def __init__(
+        self,
+        releases: dict[int, float] | None = None,
+        hidden: set[int] | None = None,
+        latency: float = 0.0,
+        slow_ratio: float = 0.0,
+        slow_latency: float = 1.0,
+        rate_limit_every: int = 0,
+        retry_after: float = 1.0,
+        characters: list[dict] | None = None,
+    ) -> None:
+        self.releases = dict(releases or {})   # collection ID -> release time
+        self.hidden = set(hidden or ())       # IDs that never become visible
+        self.latency = latency                # base delay for every response
+        self.slow_ratio = slow_ratio          # share of responses delayed further
+        self.slow_latency = slow_latency
+        self.rate_limit_every = rate_limit_every  # every N-th collection GET gets 429
+        self.retry_after = retry_after
+        self.characters = characters or [
+            {"id": 1, "name": "Common", "price": 100, "left": 5000},
+            {"id": 2, "name": "Rare", "price": 250, "left": 1000},
+            {"id": 3, "name": "Epic", "price": 1000, "left": 100},
+        ]
+
+    def release(self, collection_id: int, at: float | None = None) -> None:
+        """Schedule *collection_id* to appear at monotonic time *at* (now by default)."""
+        self.releases[collection_id] = time.monotonic() if at is None else at
+
+    def is_released(self, collection_id: int) -> bool:
+        at = self.releases.get(collection_id)
+        return (
+            at is not None
+            and collection_id not in self.hidden
+            and time.monotonic() >= at
+        )
+
+
+def fake_jwt(lifetime: int = 3600) -> str:
+    """Unsigned JWT whose "exp" claim token_manager can decode."""
+    def enc(obj) -> str:
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).rstrip(b"=").decode()
+    now = int(time.time())
+    return f"{enc({'alg': 'none'})}.{enc({'iat': now, 'exp': now + lifetime})}.fake"
+
+
+class FakeStickerDom:
+    """aiohttp application serving a Scenario, with per-endpoint counters."""
+
+    def __init__(self, scenario: Scenario) -> None:
+        self.scenario = scenario
+        self.counts: Counter = Counter()
+        self.base_url = ""
+        self._runner: web.AppRunner | None = None
+        self._collection_gets = 0
+
+        self.app = web.Application()
+        self.app.router.add_route("HEAD", "/", self.root)
+        self.app.router.add_get("/api/v1/collection/{id}", self.collection)
+        self.app.router.add_post("/api/v1/shop/buy", self.buy)
+        self.app.router.add_post("/api/v1/auth", self.auth)
+
+    def endpoints(self) -> dict[str, str]:
+        """URLs to put into http_transport.ENDPOINTS."""
+        return {
+            "root": f"{self.base_url}/",
+            "collection": f"{self.base_url}/api/v1/collection/",
+            "buy": f"{self.base_url}/api/v1/shop/buy",
+            "auth": f"{self.base_url}/api/v1/auth",
+        }
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _delay(self) -> None:
+        delay = self.scenario.latency
+        if self.scenario.slow_ratio and random.random() < self.scenario.slow_ratio:
+            delay += self.scenario.slow_latency
+        if delay:
+            await asyncio.sleep(delay)
+
+    # -- handlers --------------------------------------------------------------
+
+    async def root(self, request: web.Request) -> web.Response:
+        self.counts["root"] += 1
+        return web.Response()
+
+    async def collection(self, request: web.Request) -> web.Response:
+        self.counts["collection"] += 1
+        self._collection_gets += 1
+        await self._delay()
+        every = self.scenario.rate_limit_every
+        if every and self._collection_gets % every == 0:
+            self.counts["429"] += 1
+            return web.json_response(
+                {"ok": False, "error": "Too Many Requests"},
+                status=429,
+                headers={"Retry-After": str(self.scenario.retry_after)},
+            )
+        collection_id = int(request.match_info["id"])
+        if not self.scenario.is_released(collection_id):
+            return self._conditional(request, {"ok": False, "error": "Not found"}, 404)
+        return self._conditional(request, {
+            "ok": True,
+            "data": {
+                "id": collection_id,
+                "title": f"Collection {collection_id}",
+                "characters": self.scenario.characters,
+            },
+        }, 200)
+
+    def _conditional(self, request: web.Request, payload: dict, status: int) -> web.Response:
+        """JSON response with an ETag; 304 if the client already has this body."""
+        body = json.dumps(payload).encode()
+        etag = f'"{status}-{hashlib.sha1(body).hexdigest()[:16]}"'
+        if request.headers.get("If-None-Match") == etag:
+            self.counts["304"] += 1
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(
+            body=body, status=status, content_type="application/json", headers={"ETag": etag}
+        )
+
+    async def buy(self, request: web.Request) -> web.Response:
+        self.counts["buy"] += 1
+        await self._delay()
+        collection_id = int(request.query["collection"])
+        character_id = int(request.query["character"])
+        if not self.scenario.is_released(collection_id):
+            return web.json_response({"ok": False, "error": "Not on sale"}, status=400)
+        slug = f"c{collection_id}-ch{character_id}-{self.counts['buy']}"
+        return web.json_response({"ok": True, "data": {"url": f"https://t.me/${slug}"}})
+
+    async def auth(self, request: web.Request) -> web.Response:
+        self.counts["auth"] += 1
+        await self._delay()
+        if not await request.read():
+            return web.json_response({"ok": False, "error": "Empty payload"}, status=400)
+        return web.json_response({"ok": True, "data": fake_jwt()})
+
+
+async def _serve(port: int, first_id: int, drop_after: float) -> None:
+    scenario = Scenario()
+    scenario.release(first_id, time.monotonic() + drop_after)
+    server = FakeStickerDom(scenario)
+    base_url = await server.start(port=port)
+    print(f"Fake StickerDom listening on {base_url}; collection {first_id} drops in {drop_after}s")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local fake StickerDom API.")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--first-id", type=int, default=1)
+    parser.add_argument("--drop-after", type=float, default=10.0)
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args.port, args.first_id, args.drop_after))
+    except KeyboardInterrupt:
+        print("\n⏹  Fake StickerDom stopped")
@@ -0,0 +1,106 @@
+# fake_telegram.py
+"""
+Подделка TelegramClient для бенчмарков и отладки без сети.
+
+Отвечает на ``GetPaymentFormRequest``, ``SendStarsFormRequest``,
+``RequestWebViewRequest`` и ``GetStateRequest`` с заданной задержкой и
+записывает время каждого вызова. ``announce()`` имитирует входящее
+сообщение для обработчиков событий (push-обнаружение, detection.py).
+Подключается через ``tg_session.use_client(FakeTelegramClient())``.
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import time
+from types import SimpleNamespace
+
+from telethon import events
+from telethon.errors import rpc_message_to_error
+
+
+class FakeTelegramClient:
+    """Minimal async stand-in for the parts of TelegramClient the project uses."""
+
+    def __init__(self, rtt: float = 0.0, send_errors: list[str] | None = None) -> None:
+        self.rtt = rtt                        # simulated round-trip per RPC
+        self.send_errors = list(send_errors or [])  # RPC error messages for SendStars, in order
+        self.calls: list[tuple[float, str, object]] = []
+        self.sent: list[tuple[float, str]] = []      # (monotonic time, invoice slug)
+        self._connected = False
+        self._form_ids = itertools.count(1)
+        self._handlers: list[tuple[object, object]] = []
+
+    # -- connection --------------------------------------------------------------
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    async def start(self):
+        self._connected = True
+        return self
+
+    async def connect(self) -> None:
+        self._connected = True
+
+    async def disconnect(self) -> None:
+        self._connected = False
+
+    # -- high-level helpers ----------------------------------------------------
+
+    async def get_me(self):
+        return SimpleNamespace(id=1, first_name="Bench")
+
+    async def get_input_entity(self, peer):
+        return SimpleNamespace(user_id=42, access_hash=0, username=str(peer))
+
+    get_entity = get_input_entity
+
+    async def send_message(self, entity, message):
+        await self._rtt()
+        self.calls.append((time.monotonic(), "SendMessage", message))
+        return SimpleNamespace(id=len(self.calls))
+
+    # -- updates ---------------------------------------------------------------
+
+    def add_event_handler(self, callback, event=None) -> None:
+        self._handlers.append((callback, event))
+
+    def remove_event_handler(self, callback, event=None) -> int:
+        before = len(self._handlers)
+        self._handlers = [(cb, ev) for cb, ev in self._handlers if not (cb == callback and ev is event)]
+        return before - len(self._handlers)
+
+    async def announce(self, text: str) -> None:
+        """Deliver a new text message to every registered handler."""
+        message = SimpleNamespace(message=text, entities=None, reply_markup=None)
+        event = SimpleNamespace(raw_text=text, message=message)
+        for callback, builder in list(self._handlers):
+            await callback(message if builder is events.Raw else event)
+
+    # -- raw requests -----------------------------------------------------------
+
+    async def __call__(self, request):
+        name = type(request).__name__
+        await self._rtt()
+        self.calls.append((time.monotonic(), name, request))
+
+        if name == "GetPaymentFormRequest":
+            return SimpleNamespace(form_id=next(self._form_ids), invoice=request.invoice)
+        if name == "SendStarsFormRequest":
+            self.sent.append((time.monotonic(), request.invoice.slug))
+            if self.send_errors:
+                message = self.send_errors.pop(0)
+                code = 420 if message.startswith("FLOOD_WAIT_") else 400
+                raise rpc_message_to_error(SimpleNamespace(error_code=code, error_message=message), request)
+            return SimpleNamespace(ok=True, form_id=request.form_id)
+        if name == "RequestWebViewRequest":
+            payload = "query_id%3DAAA%26user%3D%257B%2522id%2522%253A1%257D%26hash%3Dfake"
+            return SimpleNamespace(url=f"https://app.stickerdom.store/#tgWebAppData={payload}&tgWebAppVersion=8.0")
+        if name == "GetStateRequest":
+            return SimpleNamespace(pts=0, qts=0, date=0, seq=0)
+        raise NotImplementedError(f"FakeTelegramClient does not handle {name}")
+
+    async def _rtt(self) -> None:
+        if self.rtt:
+            await asyncio.sleep(self.rtt)
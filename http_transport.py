@@ -0,0 +1,206 @@
+# http_transport.py
+"""
+Общий асинхронный HTTP-транспорт для всех запросов к StickerDom.
+
+Все модули (монитор, покупка, менеджер токенов) ходят в API через один
+aiohttp-клиент с пулом keep-alive соединений, кешем DNS и таймаутами
+для каждого типа запроса. Благодаря этому запрос ``/shop/buy`` в момент
+выхода коллекции уходит по уже открытому TLS-соединению.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+
+import aiohttp
+
+try:
+    import orjson  # optional, noticeably faster than the stdlib parser
+except ImportError:
+    orjson = None
+
+from params import (
+    API_ROOT,
+    AUTH_URL,
+    BASE_URL,
+    BUY_URL,
+    DNS_CACHE_TTL,
+    HTTP_KEEPALIVE_SECONDS,
+    HTTP_POOL_SIZE,
+    HTTP_TIMEOUTS,
+    USER_AGENT,
+)
+
+# URLs the transport talks to. bench.py points these at a local fake server.
+ENDPOINTS = {
+    "root": API_ROOT,
+    "collection": BASE_URL,
+    "buy": BUY_URL,
+    "auth": AUTH_URL,
+}
+
+# Exceptions a caller should expect from any transport call.
+TransportError = (aiohttp.ClientError, asyncio.TimeoutError)
+
+DEFAULT_HEADERS = {
+    "User-Agent": USER_AGENT,
+    "Accept": "application/json",
+}
+
+# Extra headers the Web App sends when exchanging tgWebAppData for a token.
+AUTH_HEADERS = {
+    "Origin": "https://app.stickerdom.store",
+    "Referer": "https://app.stickerdom.store/",
+    "Content-Type": "application/x-www-form-urlencoded",
+}
+
+
+def loads(body: bytes):
+    """Parse JSON with orjson when it is installed. Raises ``ValueError`` on bad input."""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+class HttpResponse:
+    """
+    A fully-read HTTP response.
+
+    *not_modified* marks an answer rebuilt from the collection cache after
+    a 304 (see sticker_monitor.probe): *status* is then the cached one.
+    """
+
+    __slots__ = ("status", "reason", "headers", "body", "not_modified")
+
+    def __init__(self, status: int, reason: str, headers, body: bytes, not_modified: bool = False) -> None:
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.not_modified = not_modified
+
+    @property
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+    def json(self):
+        """Decode the body as JSON. Raises ``ValueError`` on malformed input."""
+        return loads(self.body)
+
+
+class StickerDomTransport:
+    """Pooled keep-alive HTTP client bound to a single event loop."""
+
+    def __init__(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_SIZE,
+            use_dns_cache=True,
+            ttl_dns_cache=DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            headers=DEFAULT_HEADERS,
+        )
+
+    @property
+    def closed(self) -> bool:
+        return self._session.closed
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        endpoint: str,
+        bearer: str | None = None,
+        headers: dict | None = None,
+        **kwargs,
+    ) -> HttpResponse:
+        """Send a request and read the whole body within the *endpoint* timeout."""
+        headers = dict(headers or {})
+        if bearer:
+            headers["Authorization"] = f"Bearer {bearer}"
+        timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUTS[endpoint])
+        async with self._session.request(
+            method, url, headers=headers, timeout=timeout, **kwargs
+        ) as resp:
+            body = await resp.read()
+            return HttpResponse(resp.status, resp.reason or "", resp.headers, body)
+
+    async def get_collection(
+        self,
+        collection_id: int,
+        bearer: str,
+        etag: str | None = None,
+        last_modified: str | None = None,
+    ) -> HttpResponse:
+        """GET a collection; pass the cached validators to allow a 304 reply."""
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return await self.request(
+            "GET", f"{ENDPOINTS['collection']}{collection_id}",
+            endpoint="collection", bearer=bearer, headers=headers,
+        )
+
+    async def buy(self, collection_id: int, character_id: int, bearer: str) -> HttpResponse:
+        params = {"collection": collection_id, "character": character_id}
+        return await self.request(
+            "POST", ENDPOINTS["buy"], endpoint="buy", bearer=bearer, params=params
+        )
+
+    async def auth(self, payload: bytes) -> HttpResponse:
+        return await self.request(
+            "POST", ENDPOINTS["auth"], endpoint="auth", headers=AUTH_HEADERS, data=payload
+        )
+
+    async def warm(self) -> None:
+        """Resolve DNS and open a TLS connection so the next call reuses it."""
+        try:
+            await self.request("HEAD", ENDPOINTS["root"], endpoint="warm")
+        except TransportError as exc:
+            print(f"⚠️  Could not pre-open a connection to {ENDPOINTS['root']}: {exc}")
+
+    async def close(self) -> None:
+        await self._session.close()
+
+
+# ---------------------------------------------------------------------------
+# Process-wide instance
+# ---------------------------------------------------------------------------
+
+_transport: StickerDomTransport | None = None
+_factory = StickerDomTransport
+
+
+def get_transport() -> StickerDomTransport:
+    """Return the shared transport, creating it for the running event loop."""
+    global _transport
+    loop = asyncio.get_running_loop()
+    if _transport is None or _transport.closed or _transport.loop is not loop:
+        _transport = _factory()
+    return _transport
+
+
+def set_transport_factory(factory) -> None:
+    """
+    Build the shared transport with *factory* from now on.
+
+    Used by traffic.py to record or replay StickerDom traffic; the factory
+    must return a StickerDomTransport (or a subclass) for the running loop.
+    """
+    global _factory, _transport
+    _factory = factory
+    _transport = None
+
+
+async def close_transport() -> None:
+    """Close the shared transport if it belongs to the running event loop."""
+    global _transport
+    if _transport is not None and _transport.loop is asyncio.get_running_loop():
+        await _transport.close()
+    _transport = None
@@ -0,0 +1,139 @@
+# metrics.py
+"""
+Лёгкая инструментация этапов покупки.
+
+``span()`` замеряет этап по монотонным часам и кладёт длительность в
+гистограмму в памяти. Раз в ``METRICS_FLUSH_SECONDS`` гистограммы
+выгружаются в текстовый файл формата Prometheus, а события — в JSONL-лог.
+Запись на диск идёт только при выгрузке, поэтому на горячем пути
+остаются лишь ``perf_counter()`` и пара операций со словарём.
+"""
+from __future__ import annotations
+
+import asyncio
+import bisect
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from params import (
+    METRICS_ENABLED,
+    METRICS_EVENTS_FILE,
+    METRICS_FLUSH_SECONDS,
+    METRICS_PROM_FILE,
+)
+
+# Upper bounds, in seconds, of the histogram buckets (+Inf is implicit).
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+_histograms: dict[tuple[str, str], Histogram] = {}
+_events: list[dict] = []
+
+
+def observe(stage: str, seconds: float, outcome: str = "ok", **fields) -> None:
+    """Record one measurement of *stage*; extra *fields* go to the event log only."""
+    if not METRICS_ENABLED:
+        return
+    key = (stage, outcome)
+    hist = _histograms.get(key)
+    if hist is None:
+        hist = _histograms[key] = Histogram()
+    hist.observe(seconds)
+    _events.append({
+        "ts": time.time(),
+        "stage": stage,
+        "duration_ms": round(seconds * 1000, 3),
+        "outcome": outcome,
+        **fields,
+    })
+
+
+@contextmanager
+def span(stage: str, **fields):
+    """
+    Time the enclosed block as *stage*.
+
+    Yields a dict; anything the block stores in it (e.g. an HTTP status) is
+    added to the event. An exception marks the span with its class name.
+    """
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield fields
+    except BaseException as exc:
+        outcome = type(exc).__name__
+        raise
+    finally:
+        observe(stage, time.perf_counter() - started, fields.pop("outcome", outcome), **fields)
+
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+
+def render_prometheus() -> str:
+    """Render all histograms in the Prometheus text exposition format."""
+    lines = [
+        "# HELP stickers_stage_seconds Duration of purchase-path stages.",
+        "# TYPE stickers_stage_seconds histogram",
+    ]
+    for (stage, outcome), hist in sorted(_histograms.items()):
+        labels = f'stage="{stage}",outcome="{outcome}"'
+        cumulative = 0
+        for bound, count in zip((*BUCKETS, "+Inf"), hist.counts):
+            cumulative += count
+            lines.append(f'stickers_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"stickers_stage_seconds_sum{{{labels}}} {hist.total:.6f}")
+        lines.append(f"stickers_stage_seconds_count{{{labels}}} {hist.count}")
+    return "\n".join(lines) + "\n"
+
+
+def summary() -> dict[tuple[str, str], tuple[int, float]]:
+    """(stage, outcome) -> (count, total seconds) for everything observed so far."""
+    return {key: (hist.count, hist.total) for key, hist in _histograms.items()}
+
+
+def flush() -> None:
+    """Append pending events to the JSONL log and rewrite the Prometheus file."""
+    if not METRICS_ENABLED:
+        return
+    global _events
+    events, _events = _events, []
+    try:
+        if events:
+            with open(METRICS_EVENTS_FILE, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(e, ensure_ascii=False) + "\n" for e in events)
+        tmp = f"{METRICS_PROM_FILE}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(render_prometheus())
+        os.replace(tmp, METRICS_PROM_FILE)
+    except OSError as exc:
+        print(f"⚠️  Could not write metrics: {exc}")
+
+
+async def flush_loop() -> None:
+    """Flush metrics every METRICS_FLUSH_SECONDS, and once more when cancelled."""
+    try:
+        while True:
+            await asyncio.sleep(METRICS_FLUSH_SECONDS)
+            flush()
+    finally:
+        flush()
@@ -0,0 +1,136 @@
+# notifier.py
+"""
+Фоновые уведомления о покупках.
+
+Путь покупки только кладёт событие в память (``record()`` ничего не
+ждёт), а отдельная задача ``run()`` раз в секунду собирает сводки и
+отправляет их в приёмники: «Избранное» в Telegram, stdout, файл
+(``NOTIFY_SINKS``). События одной коллекции схлопываются: по каждому
+персонажу остаются число попыток, последний итог и ссылка на оплату.
+Сводка уходит, когда по коллекции ``NOTIFY_QUIET_SECONDS`` не было
+новых событий, и несколько готовых коллекций отправляются одним
+сообщением — вместо десяти сообщений на один выход приходит одно.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+
+from params import NOTIFY_FILE, NOTIFY_QUIET_SECONDS, NOTIFY_SINKS
+from tg_session import get_client
+
+
+class Sink:
+    """Base class: delivers one notification text."""
+
+    async def send(self, text: str) -> None:
+        raise NotImplementedError
+
+
+class StdoutSink(Sink):
+    async def send(self, text: str) -> None:
+        print(f"📬 {text}")
+
+
+class FileSink(Sink):
+    def __init__(self, path: str = NOTIFY_FILE) -> None:
+        self.path = path
+
+    async def send(self, text: str) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}]\n{text}\n\n")
+
+
+class SavedMessagesSink(Sink):
+    async def send(self, text: str) -> None:
+        client = await get_client()
+        await client.send_message("me", text)
+
+
+SINKS = {"saved_messages": SavedMessagesSink, "stdout": StdoutSink, "file": FileSink}
+
+
+def make_sinks(names=NOTIFY_SINKS) -> list[Sink]:
+    """Build the sinks named in params.NOTIFY_SINKS."""
+    try:
+        return [SINKS[name]() for name in names]
+    except KeyError as exc:
+        raise ValueError(f"Unknown notification sink: {exc.args[0]!r}") from None
+
+
+class _CharacterSummary:
+    __slots__ = ("attempts", "outcome", "detail", "payment_url")
+
+    def __init__(self) -> None:
+        self.attempts = 0
+        self.outcome = ""
+        self.detail = ""
+        self.payment_url: str | None = None
+
+
+class Notifier:
+    """Collects purchase events per collection and sends batched summaries."""
+
+    def __init__(self, sinks: list[Sink] | None = None) -> None:
+        self.sinks = make_sinks() if sinks is None else sinks
+        self._pending: dict[int, dict[int, _CharacterSummary]] = {}
+        self._updated: dict[int, float] = {}
+
+    def record(self, collection_id: int, character_id: int, result, payment_url: str | None = None) -> None:
+        """Note the *result* of one purchase attempt. Never blocks."""
+        summary = self._pending.setdefault(collection_id, {}).setdefault(character_id, _CharacterSummary())
+        summary.attempts += 1
+        summary.outcome = result.outcome.value
+        summary.detail = result.detail
+        summary.payment_url = payment_url or summary.payment_url
+        self._updated[collection_id] = time.monotonic()
+
+    async def flush(self, everything: bool = False) -> None:
+        """Send the summaries of collections that went quiet (or all of them)."""
+        now = time.monotonic()
+        ready = [
+            collection_id for collection_id, updated in self._updated.items()
+            if everything or now - updated >= NOTIFY_QUIET_SECONDS
+        ]
+        if not ready:
+            return
+        text = "\n\n".join(self._render(cid, self._pending.pop(cid)) for cid in sorted(ready))
+        for collection_id in ready:
+            del self._updated[collection_id]
+        for sink in self.sinks:
+            try:
+                await sink.send(text)
+            except Exception as exc:
+                print(f"⚠️  Could not send a notification via {type(sink).__name__}: {exc}")
+
+    @staticmethod
+    def _render(collection_id: int, characters: dict[int, _CharacterSummary]) -> str:
+        lines = [f"🧾 Коллекция {collection_id}"]
+        for character_id, summary in sorted(characters.items()):
+            line = f"• персонаж {character_id}: {summary.outcome}, попыток: {summary.attempts}"
+            if summary.detail:
+                line += f" ({summary.detail})"
+            lines.append(line)
+            if summary.payment_url:
+                lines.append(f"  💳 Ссылка на оплату: {summary.payment_url}")
+        return "\n".join(lines)
+
+    async def run(self) -> None:
+        """Drain the queue in the background; sends everything left when cancelled."""
+        try:
+            while True:
+                await asyncio.sleep(min(1.0, NOTIFY_QUIET_SECONDS))
+                await self.flush()
+        finally:
+            await self.flush(everything=True)
+
+
+_notifier: Notifier | None = None
+
+
+def get_notifier() -> Notifier:
+    """Return the process-wide notifier."""
+    global _notifier
+    if _notifier is None:
+        _notifier = Notifier()
+    return _notifier
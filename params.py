@@ -1,14 +1,26 @@
 BASE_URL = "https://api.stickerdom.store/api/v1/collection/"
 
+# Endpoint that returns a Telegram payment URL for a collection/character.
+BUY_URL = "https://api.stickerdom.store/api/v1/shop/buy"
+
 # Time to wait in seconds between checks if no new sticker is found.
 CHECK_INTERVAL_SECONDS = 5
 
-# File to store the ID of the last successfully found sticker.
+# Legacy file with the ID of the last found sticker. It is imported into
+# STATE_DB_FILE once and no longer written.
 LAST_ID_FILE = "last_sticker_id.txt"
 
-# How many times to attempt purchasing each new collection.
+# Maximum number of purchase attempts per new collection. Attempts stop
+# early on success or on a permanent failure (see pipeline.retry_delay).
 PURCHASE_COUNT = 10
 
+# Backoff, in seconds, after a transient purchase failure: doubles each time.
+RETRY_BACKOFF_BASE = 0.5
+RETRY_BACKOFF_MAX = 10
+
+# Give up instead of waiting if Telegram asks for a longer flood-wait (seconds).
+FLOOD_WAIT_MAX = 300
+
 # ID of the character to use in purchase requests.
 CHARACTER_ID = 2
 
@@ -25,3 +37,231 @@ BOT_USERNAME = "sticker_bot"
 
 # How often, in seconds, to refresh the bearer token (30 minutes by default).
 REFRESH_EVERY = 30 * 2  # 30 минут (set small for testing)
+
+# ---------------------------------------------------------------------------
+# HTTP transport settings (see http_transport.py)
+# ---------------------------------------------------------------------------
+
+# Root of the StickerDom API. Used to pre-open a keep-alive connection.
+API_ROOT = "https://api.stickerdom.store/"
+
+# Shared User-Agent sent with every StickerDom request.
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+# Maximum number of simultaneous connections kept in the pool.
+HTTP_POOL_SIZE = 20
+
+# How long, in seconds, an idle keep-alive connection stays in the pool.
+HTTP_KEEPALIVE_SECONDS = 120
+
+# How long, in seconds, resolved DNS entries are cached.
+DNS_CACHE_TTL = 600
+
+# Total timeout, in seconds, for each kind of request.
+HTTP_TIMEOUTS = {
+    "collection": 5,
+    "buy": 10,
+    "auth": 15,
+    "warm": 5,
+}
+
+# ---------------------------------------------------------------------------
+# Telegram client settings (see tg_session.py)
+# ---------------------------------------------------------------------------
+
+# How often, in seconds, the shared Telegram client checks its connection.
+TG_KEEPALIVE_SECONDS = 60
+
+# How often, in seconds, the in-memory Telegram session is saved to disk.
+TG_SESSION_PERSIST_SECONDS = 10 * 60
+
+# ---------------------------------------------------------------------------
+# Bearer-token cache settings (see token_manager.py)
+# ---------------------------------------------------------------------------
+
+# How often, in seconds, get_bearer() checks whether bearer_token.txt changed.
+TOKEN_CHECK_INTERVAL = 5
+
+# Refresh the token this many seconds before its "exp" claim runs out.
+TOKEN_REFRESH_MARGIN = 120
+
+# Delay, in seconds, before retrying a failed scheduled refresh.
+TOKEN_RETRY_SECONDS = 30
+
+# ---------------------------------------------------------------------------
+# Look-ahead probing (see sticker_monitor.py)
+# ---------------------------------------------------------------------------
+
+# After a 404 on last_id+1, also probe last_id+2 .. last_id+LOOKAHEAD_WINDOW
+# so a skipped or hidden collection ID does not stall the monitor.
+LOOKAHEAD_WINDOW = 4
+
+# Probe ahead only after this many 404s in a row (and then again after as
+# many more), so an idle monitor does not spend the look-ahead budget.
+LOOKAHEAD_AFTER_MISSES = 3
+
+# How many look-ahead probes may be in flight at once.
+LOOKAHEAD_CONCURRENCY = 2
+
+# Upper bound on look-ahead probes per minute (on top of the regular polls).
+LOOKAHEAD_BUDGET_PER_MINUTE = 4
+
+# ---------------------------------------------------------------------------
+# Poll scheduler (see poll_scheduler.py)
+# ---------------------------------------------------------------------------
+
+# "adaptive" learns drop times and honors backoff; "fixed" keeps the plain
+# CHECK_INTERVAL_SECONDS behaviour.
+POLL_SCHEDULER = "adaptive"
+
+# Poll interval, in seconds, inside a historical drop window. When the
+# windows cover so much of the day that this would send more requests per
+# day than polling every CHECK_INTERVAL_SECONDS, the dense interval is
+# stretched to keep the daily total at that level.
+POLL_INTERVAL_DENSE = 1.5
+
+# Poll interval, in seconds, outside of drop windows.
+POLL_INTERVAL_SPARSE = 10
+
+# Half-width, in minutes, of the daily window around each recorded drop.
+DROP_WINDOW_MINUTES = 20
+
+# Random spread applied to every delay (0.2 = ±20%).
+POLL_JITTER = 0.2
+
+# Longest backoff, in seconds, after repeated errors or 429s.
+POLL_BACKOFF_MAX = 120
+
+# How many recent drops the scheduler remembers.
+DROP_HISTORY_LIMIT = 50
+
+# ---------------------------------------------------------------------------
+# Metrics (see metrics.py)
+# ---------------------------------------------------------------------------
+
+# Set to False to turn all stage timing off.
+METRICS_ENABLED = True
+
+# How often, in seconds, metrics are written to disk.
+METRICS_FLUSH_SECONDS = 15
+
+# Prometheus text-format file with per-stage latency histograms.
+METRICS_PROM_FILE = "metrics.prom"
+
+# Structured JSONL log with one event per timed stage.
+METRICS_EVENTS_FILE = "events.jsonl"
+
+# ---------------------------------------------------------------------------
+# State store (see state_store.py)
+# ---------------------------------------------------------------------------
+
+# SQLite database with last ID, seen collections, attempts and drop history.
+STATE_DB_FILE = "state.db"
+
+# fsync policy: "normal" (no fsync per commit, survives process crashes),
+# "full" (fsync every commit, survives power loss) or "off".
+STATE_SYNC = "normal"
+
+# Unfinished purchases of collections seen within this many hours are
+# resumed on start-up.
+STATE_RESUME_HOURS = 24
+
+# ---------------------------------------------------------------------------
+# Collection metadata cache (see collection_cache.py)
+# ---------------------------------------------------------------------------
+
+# How many collections (payload + ETag/Last-Modified) are kept in memory.
+# Keep it above the number of watched collections (see watchlist.py).
+COLLECTION_CACHE_SIZE = 1024
+
+# ---------------------------------------------------------------------------
+# Purchase planner (see purchase_planner.py)
+# ---------------------------------------------------------------------------
+
+# Characters to buy from every new collection, highest priority first.
+PURCHASE_CHARACTERS = [CHARACTER_ID]
+
+# Per-collection overrides of PURCHASE_CHARACTERS: {collection_id: [character IDs]}.
+COLLECTION_CHARACTERS = {}
+
+# Total Stars the bot may spend, counted across restarts from state.db.
+# None means no limit.
+STARS_BUDGET = None
+
+# How many characters of one collection are bought at the same time.
+PURCHASE_CONCURRENCY = 3
+
+# ---------------------------------------------------------------------------
+# Push detection (see detection.py)
+# ---------------------------------------------------------------------------
+
+# Also watch Telegram for new-collection announcements; polling stays on
+# as the fallback.
+PUSH_ENABLED = True
+
+# Chats whose new messages are scanned for collection IDs: the shop bot
+# and/or an announcement channel (usernames or numeric IDs).
+PUSH_CHATS = [BOT_USERNAME]
+
+# Regular expression whose first group is the collection ID, matched
+# against the message text and the URLs of its links and buttons.
+PUSH_ID_PATTERN = r"(?:collection|коллекци\w*)[\s/_=:#№-]*(\d+)"
+
+# Push counts as quiet when no Telegram update at all arrived for this
+# many seconds; the poller then runs at its normal rate again.
+PUSH_QUIET_SECONDS = 300
+
+# Polls are spaced at least this far apart (seconds) while push is trusted:
+# it reported each of the last PUSH_TRUST_DROPS drops before the poller
+# did, and Telegram updates keep arriving.
+PUSH_BACKSTOP_INTERVAL = 30
+PUSH_TRUST_DROPS = 3
+
+# A pushed ID is bought only once the API serves it: it is probed every
+# PUSH_PROBE_INTERVAL seconds for up to PUSH_PROBE_SECONDS, then left to
+# the poller. IDs more than LOOKAHEAD_WINDOW past the last found one are
+# ignored.
+PUSH_PROBE_INTERVAL = 0.5
+PUSH_PROBE_SECONDS = 60
+
+# ---------------------------------------------------------------------------
+# Warm standby (see daemon.py, "stickers standby")
+# ---------------------------------------------------------------------------
+
+# Wake up, connect and warm everything this many seconds before the drop.
+STANDBY_LEAD_SECONDS = 120
+
+# The bearer token is refreshed ahead of time if it would otherwise expire
+# within this many seconds after the drop.
+STANDBY_HOLD_SECONDS = 600
+
+# ---------------------------------------------------------------------------
+# Watchlist of known collections (see watchlist.py)
+# ---------------------------------------------------------------------------
+
+# Default seconds between checks of one watched collection.
+WATCH_INTERVAL = 30
+
+# Upper bound on watchlist requests per minute, across all items.
+WATCH_RATE_PER_MINUTE = 60
+
+# How many watchlist checks may be in flight at once.
+WATCH_CONCURRENCY = 4
+
+# How often, in seconds, the running watchlist picks up items added or
+# removed from another process ("stickers watch add ...").
+WATCH_RELOAD_SECONDS = 60
+
+# ---------------------------------------------------------------------------
+# Notifications (see notifier.py)
+# ---------------------------------------------------------------------------
+
+# Where purchase summaries go: "saved_messages", "stdout" and/or "file".
+NOTIFY_SINKS = ["saved_messages"]
+
+# A collection's summary is sent once no new attempt happened for this
+# many seconds.
+NOTIFY_QUIET_SECONDS = 10
+
+# Log file of the "file" sink.
+NOTIFY_FILE = "notifications.log"
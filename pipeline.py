@@ -0,0 +1,120 @@
+# pipeline.py
+"""
+Асинхронный конвейер покупки: обнаружение → ссылка на оплату →
+платёжная форма → оплата звёздами.
+
+Все соединения открываются заранее (``prewarm``), а между стадиями нет
+пауз. Повторные попытки решает ``retry_delay`` по типизированному
+результату предыдущей: успех или окончательный отказ — стоп, истёкший
+счёт — сразу новый, FloodWait — ровно столько, сколько просит Telegram.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+
+import metrics
+from http_transport import get_transport
+from notifier import get_notifier
+from params import BOT_USERNAME, FLOOD_WAIT_MAX, RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX
+from purchase_sticker import (
+    Outcome,
+    PurchaseResult,
+    classify_error,
+    complete_payment,
+    get_payment_url,
+    invoice_slug,
+)
+from state_store import get_store
+from tg_session import get_client
+from token_manager import get_bearer
+
+
+async def prewarm() -> None:
+    """Open the HTTP and MTProto connections and fill the caches ahead of a drop."""
+    started = time.monotonic()
+    client, _ = await asyncio.gather(get_client(), get_transport().warm())
+    try:
+        # Caches the bot entity so a token refresh does not need a username lookup.
+        await client.get_input_entity(BOT_USERNAME)
+    except Exception as exc:
+        print(f"⚠️  Could not resolve @{BOT_USERNAME}: {exc}")
+    try:
+        get_bearer()
+    except RuntimeError as exc:
+        print(f"⚠️  {exc}")
+    print(f"🔥 Pre-warm finished in {(time.monotonic() - started) * 1000:.0f} ms")
+
+
+def retry_delay(result: PurchaseResult, transient_failures: int) -> float | None:
+    """Seconds to wait before the next attempt after *result*, or None to stop."""
+    if result.final:
+        return None
+    if result.outcome is Outcome.FLOOD_WAIT:
+        return result.retry_after if result.retry_after <= FLOOD_WAIT_MAX else None
+    if result.outcome is Outcome.INVOICE_EXPIRED:
+        return 0.0  # the invoice just needs re-fetching
+    return min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** (transient_failures - 1))
+
+
+async def purchase_pipeline(
+    collection_id: int,
+    character_id: int,
+    attempts: int,
+    detected_at: float | None = None,
+    price: int | None = None,
+) -> PurchaseResult | None:
+    """
+    Buy *character_id* of *collection_id*, making at most *attempts* attempts.
+
+    Stops on success or a permanent failure, re-fetches the invoice when it
+    expired, sleeps exactly the flood-wait Telegram asks for and backs off
+    exponentially on transient errors. Every attempt is journaled in the
+    state store (with the Stars *price*, if known), so a restarted process
+    only runs the attempts that are left.
+    """
+    detected_at = detected_at or time.monotonic()
+    store = get_store()
+    if store.is_done(collection_id, character_id):
+        print(f"Collection {collection_id}, character {character_id} needs no more attempts; skipping")
+        return None
+    # Attempts journaled before a crash or restart count against the total.
+    first = store.attempts_made(collection_id, character_id) + 1
+
+    result = None
+    transient_failures = 0
+    for attempt in range(first, attempts + 1):
+        print(f"🎯 Purchase attempt {attempt}/{attempts} for collection {collection_id}, character {character_id}…")
+        attempt_id = store.start_attempt(collection_id, character_id, price)
+        url = await get_payment_url(collection_id, character_id)
+        if url:
+            store.set_attempt_slug(attempt_id, invoice_slug(url))
+            try:
+                # Already connected after prewarm(); reconnects if Telegram dropped us.
+                client = await get_client()
+            except Exception as exc:
+                result = classify_error(exc, invoice_slug(url))
+            else:
+                result = await complete_payment(client, url)
+            elapsed = time.monotonic() - detected_at
+            metrics.observe(
+                "detect_to_send", elapsed,
+                collection=collection_id, character=character_id, attempt=attempt,
+            )
+            print(f"⏱  Attempt {attempt}: {elapsed * 1000:.0f} ms since detection")
+        else:
+            result = PurchaseResult(Outcome.NO_URL, "StickerDom returned no payment URL")
+        store.finish_attempt(attempt_id, result.outcome.value, result.detail)
+        get_notifier().record(collection_id, character_id, result, url)
+
+        if result.outcome in (Outcome.TRANSIENT, Outcome.NO_URL):
+            transient_failures += 1
+        delay = retry_delay(result, transient_failures)
+        if delay is None or attempt == attempts:
+            break
+        if delay:
+            print(f"Retrying in {delay:.1f}s ({result.outcome.value})")
+            await asyncio.sleep(delay)
+
+    print(f"Finished purchase attempts for collection {collection_id}, character {character_id}: {result}")
+    return result
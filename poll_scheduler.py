@@ -0,0 +1,173 @@
+# poll_scheduler.py
+"""
+Планировщик опроса для sticker_monitor.
+
+Решает, сколько ждать до следующего запроса к ``BASE_URL``:
+учитывает 429/503 и заголовок ``Retry-After``, добавляет случайный
+разброс и по истории выходов коллекций опрашивает часто вокруг
+«горячих» часов и редко в остальное время. Запросов в сутки при этом не
+больше, чем при прежнем опросе раз в ``CHECK_INTERVAL_SECONDS``: если
+окна покрывают слишком большую часть суток, частый интервал растягивается.
+"""
+from __future__ import annotations
+
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+from params import (
+    CHECK_INTERVAL_SECONDS,
+    DROP_HISTORY_LIMIT,
+    DROP_WINDOW_MINUTES,
+    POLL_BACKOFF_MAX,
+    POLL_INTERVAL_DENSE,
+    POLL_INTERVAL_SPARSE,
+    POLL_JITTER,
+    POLL_SCHEDULER,
+)
+from state_store import StateStore, get_store
+
+DAY = 24 * 60 * 60
+
+# Statuses that mean "slow down" rather than "nothing new yet".
+BACKOFF_STATUSES = {429, 502, 503, 504}
+
+
+class PollScheduler:
+    """Base class: decides how long the monitor waits before its next poll."""
+
+    def next_delay(self, status: int | None, headers=None) -> float:
+        """
+        Return the delay, in seconds, after a poll that ended with *status*.
+
+        *status* is ``None`` when the request itself failed (network error,
+        timeout, missing token).
+        """
+        raise NotImplementedError
+
+    def record_drop(self, timestamp: float) -> None:
+        """Called with the Unix time at which a new collection was found."""
+
+
+class FixedScheduler(PollScheduler):
+    """The original behaviour: a fixed interval, doubled after an error."""
+
+    def __init__(self, interval: float = CHECK_INTERVAL_SECONDS) -> None:
+        self.interval = interval
+
+    def next_delay(self, status: int | None, headers=None) -> float:
+        return self.interval * 2 if status is None else self.interval
+
+
+class AdaptiveScheduler(PollScheduler):
+    """Backoff-aware, jittered scheduler that learns when drops happen."""
+
+    def __init__(self, store: StateStore | None = None) -> None:
+        self.store = store or get_store()
+        self.drops = self.store.drop_history(DROP_HISTORY_LIMIT)
+        self.failures = 0
+        self.dense_interval = dense_interval(self.drops)
+
+    def record_drop(self, timestamp: float) -> None:
+        self.drops = (self.drops + [timestamp])[-DROP_HISTORY_LIMIT:]
+        self.store.record_drop(timestamp)
+        self.dense_interval = dense_interval(self.drops)
+
+    # -- scheduling ----------------------------------------------------------
+
+    def next_delay(self, status: int | None, headers=None) -> float:
+        if status is None or status in BACKOFF_STATUSES:
+            self.failures += 1
+            retry_after = parse_retry_after(headers)
+            if retry_after is not None:
+                # The server told us exactly how long to wait: no jitter below it.
+                return retry_after + random.uniform(0, POLL_JITTER * CHECK_INTERVAL_SECONDS)
+            delay = min(POLL_BACKOFF_MAX, CHECK_INTERVAL_SECONDS * 2 ** self.failures)
+            return _jitter(delay)
+
+        self.failures = 0
+        return _jitter(self.base_interval(time.time()))
+
+    def base_interval(self, now: float) -> float:
+        """Dense interval inside a historical drop window, sparse outside it."""
+        if not self.drops:
+            return CHECK_INTERVAL_SECONDS
+        window = DROP_WINDOW_MINUTES * 60
+        until_window = min(_seconds_until(now, ts, window) for ts in self.drops)
+        if until_window == 0:
+            return self.dense_interval
+        # Wake up right at the start of the next window instead of overshooting it.
+        return max(POLL_INTERVAL_DENSE, min(POLL_INTERVAL_SPARSE, until_window))
+
+
+def dense_seconds(drops: list[float], window: float = DROP_WINDOW_MINUTES * 60) -> float:
+    """Seconds of the day covered by the (merged) windows around *drops*."""
+    spans = []
+    for ts in drops:
+        start = (_time_of_day(ts) - window) % DAY
+        end = start + 2 * window
+        if end > DAY:  # the window wraps around midnight
+            spans += [(start, DAY), (0, end - DAY)]
+        else:
+            spans.append((start, end))
+    covered, reach = 0.0, 0.0
+    for start, end in sorted(spans):
+        if end > reach:
+            covered += end - max(start, reach)
+            reach = end
+    return min(covered, DAY)
+
+
+def dense_interval(drops: list[float]) -> float:
+    """
+    POLL_INTERVAL_DENSE, stretched when needed so that a day of polling sends
+    no more requests than a fixed CHECK_INTERVAL_SECONDS would.
+    """
+    dense = dense_seconds(drops)
+    if not dense:
+        return POLL_INTERVAL_DENSE
+    allowed = DAY / CHECK_INTERVAL_SECONDS - (DAY - dense) / POLL_INTERVAL_SPARSE
+    if allowed <= 0:
+        return POLL_INTERVAL_SPARSE
+    return max(POLL_INTERVAL_DENSE, dense / allowed)
+
+
+def _time_of_day(ts: float) -> int:
+    t = time.localtime(ts)
+    return t.tm_hour * 3600 + t.tm_min * 60 + t.tm_sec
+
+
+def _seconds_until(now: float, drop_ts: float, window: float) -> float:
+    """Seconds from *now* until the daily window around *drop_ts* opens (0 if inside)."""
+    delta = (_time_of_day(drop_ts) - _time_of_day(now)) % DAY
+    if delta <= window or delta >= DAY - window:
+        return 0
+    return delta - window
+
+
+def _jitter(delay: float) -> float:
+    return delay * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+
+
+def parse_retry_after(headers) -> float | None:
+    """Parse a Retry-After header given either in seconds or as an HTTP date."""
+    value = headers.get("Retry-After") if headers else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def make_scheduler(name: str = POLL_SCHEDULER) -> PollScheduler:
+    """Build the scheduler named in params.POLL_SCHEDULER."""
+    if name == "fixed":
+        return FixedScheduler()
+    if name == "adaptive":
+        return AdaptiveScheduler()
+    raise ValueError(f"Unknown poll scheduler: {name!r}")
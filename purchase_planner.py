@@ -0,0 +1,143 @@
+# purchase_planner.py
+"""
+Планировщик покупок с бюджетом в звёздах.
+
+Для новой коллекции берёт список персонажей по приоритету
+(``COLLECTION_CHARACTERS`` или ``PURCHASE_CHARACTERS``), читает цены и
+остаток из payload коллекции (collection_cache / state.db), резервирует
+звёзды из ``STARS_BUDGET`` и запускает pipeline.purchase_pipeline для
+выбранных персонажей параллельно, не более ``PURCHASE_CONCURRENCY`` за
+раз. Персонаж, на которого не хватает бюджета, пропускается; когда
+бюджет исчерпан, покупки прекращаются.
+"""
+from __future__ import annotations
+
+import asyncio
+
+from collection_cache import get_collection_cache
+from params import COLLECTION_CHARACTERS, PURCHASE_CHARACTERS, PURCHASE_CONCURRENCY, STARS_BUDGET
+from pipeline import purchase_pipeline
+from purchase_sticker import Outcome, PurchaseResult
+from state_store import get_store
+
+
+class StarsBudget:
+    """Stars left to spend; prices are reserved while a purchase is running."""
+
+    def __init__(self, total: int | None = STARS_BUDGET, spent: int = 0) -> None:
+        self.total = total
+        self.spent = spent
+        self.reserved = 0
+
+    @property
+    def remaining(self) -> float:
+        if self.total is None:
+            return float("inf")
+        return self.total - self.spent - self.reserved
+
+    def reserve(self, price: int | None) -> bool:
+        """Set *price* aside; False if it does not fit (or is unknown under a limit)."""
+        if self.total is None:
+            return True
+        if price is None or price > self.remaining:
+            return False
+        self.reserved += price
+        return True
+
+    def settle(self, price: int | None, paid: bool) -> None:
+        """Turn a reservation into spending, or give it back."""
+        if price is None:
+            return
+        if self.total is not None:
+            self.reserved -= price
+        if paid:
+            self.spent += price
+
+
+def character_offers(payload: dict | None) -> dict[int, dict]:
+    """Map character ID -> {"price", "left"} from a collection payload."""
+    offers = {}
+    for character in (payload or {}).get("characters") or ():
+        try:
+            offers[int(character["id"])] = {
+                "price": character.get("price"),
+                "left": character.get("left"),
+            }
+        except (KeyError, TypeError, ValueError):
+            continue
+    return offers
+
+
+def plan(collection_id: int, budget: StarsBudget) -> list[tuple[int, int | None]]:
+    """
+    Pick characters of *collection_id* in priority order and reserve their prices.
+
+    Returns (character ID, price) pairs; sold-out characters and ones the
+    budget cannot cover are skipped.
+    """
+    priority = COLLECTION_CHARACTERS.get(collection_id, PURCHASE_CHARACTERS)
+    offers = character_offers(get_collection_cache().payload(collection_id))
+    store = get_store()
+    selected = []
+    for character_id in priority:
+        offer = offers.get(character_id, {})
+        if offers and not offer:
+            print(f"Character {character_id} is not in collection {collection_id}; skipping")
+            continue
+        if offer.get("left") == 0:
+            print(f"Character {character_id} of collection {collection_id} is sold out; skipping")
+            continue
+        if store.is_done(collection_id, character_id):
+            continue
+        price = offer.get("price")
+        if not budget.reserve(price):
+            reason = "price unknown" if price is None else f"{price} ⭐ > {budget.remaining:g} ⭐ left"
+            print(f"💸 Not buying character {character_id} of collection {collection_id}: {reason}")
+            continue
+        selected.append((character_id, price))
+    return selected
+
+
+async def purchase_collection(
+    collection_id: int,
+    attempts: int,
+    detected_at: float | None = None,
+    budget: StarsBudget | None = None,
+) -> dict[int, PurchaseResult | None]:
+    """
+    Buy the planned characters of *collection_id* concurrently.
+
+    Each character gets its own purchase_pipeline() with up to *attempts*
+    attempts; results are returned per character ID.
+    """
+    budget = budget or get_budget()
+    selected = plan(collection_id, budget)
+    if not selected:
+        print(f"Nothing to buy in collection {collection_id}")
+        return {}
+    print(f"🛒 Buying characters {[c for c, _ in selected]} of collection {collection_id}")
+
+    semaphore = asyncio.Semaphore(PURCHASE_CONCURRENCY)
+
+    async def buy(character_id: int, price: int | None) -> PurchaseResult | None:
+        result = None
+        try:
+            async with semaphore:
+                result = await purchase_pipeline(collection_id, character_id, attempts, detected_at, price)
+            return result
+        finally:
+            budget.settle(price, paid=result is not None and result.outcome is Outcome.PAID)
+
+    results = await asyncio.gather(*(buy(c, p) for c, p in selected))
+    return {character_id: result for (character_id, _), result in zip(selected, results)}
+
+
+_budget: StarsBudget | None = None
+
+
+def get_budget() -> StarsBudget:
+    """Return the process-wide budget, starting from what state.db says was spent."""
+    global _budget
+    if _budget is None:
+        _budget = StarsBudget(STARS_BUDGET, get_store().stars_spent())
+    return _budget
@@ -1,35 +1,35 @@
-import requests
 import asyncio
-from telethon.sync import TelegramClient
+import enum
+from telethon.errors import FloodWaitError, RPCError, ServerError
 from telethon.tl.types import InputInvoiceSlug
 from telethon.tl.functions.payments import GetPaymentFormRequest, SendStarsFormRequest
-from token_manager import get_bearer
-import config
+import metrics
+from http_transport import TransportError, close_transport, get_transport
+from metrics import span
+from notifier import get_notifier
+from tg_session import close_client, get_client
+from token_manager import get_bearer, refresh_bearer
 from params import CHARACTER_ID
 
-# --- Credentials ---
-# Все креды теперь в config.py. Этот скрипт использует их для подключения к Telegram.
-API_ID = config.API_ID
-API_HASH = config.API_HASH
-SESSION_NAME = config.SESSION_NAME
+# Учётные данные — в config.py, настройки — в params.py. Подключение к
+# Telegram держит tg_session.py, Bearer-токен кеширует token_manager.
 
-# --- Sticker API Configuration ---
-# BEARER_TOKEN is now loaded from a file via get_bearer().
-# --- End of Configuration ---
-
-def get_payment_url(collection_id: int, character_id: int = CHARACTER_ID):
+async def get_payment_url(collection_id: int, character_id: int = CHARACTER_ID):
     """Calls the sticker API to get a Telegram payment URL for the given collection/character."""
-    print(f"Getting payment URL for collection {collection_id}, character {CHARACTER_ID}…")
-    url = "https://api.stickerdom.store/api/v1/shop/buy"
-    params = {"collection": collection_id, "character": CHARACTER_ID}
+    print(f"Getting payment URL for collection {collection_id}, character {character_id}…")
     try:
         bearer_token = get_bearer()
-        headers = {
-            "Authorization": f"Bearer {bearer_token}",
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        }
-        response = requests.post(url, headers=headers, params=params)
-        response.raise_for_status()
+        with span("buy_url", collection=collection_id, character=character_id) as fields:
+            response = await get_transport().buy(collection_id, character_id, bearer_token)
+            fields["status"] = response.status
+        if response.status == 401:
+            print("🔑 Token rejected (401). Refreshing and retrying...")
+            bearer_token = await refresh_bearer(stale_token=bearer_token)
+            with span("buy_url", collection=collection_id, character=character_id, retry=True) as fields:
+                response = await get_transport().buy(collection_id, character_id, bearer_token)
+                fields["status"] = response.status
+        if response.status >= 400:
+            raise RuntimeError(f"HTTP {response.status} {response.reason}: {response.text[:300]}")
         data = response.json()
         if data.get("ok") and data.get("data", {}).get("url"):
             payment_url = data["data"]["url"]
@@ -38,67 +38,111 @@ def get_payment_url(collection_id: int, character_id: int = CHARACTER_ID):
         else:
             print(f"API response was not as expected: {data}")
             return None
-    except (requests.exceptions.RequestException, RuntimeError) as e:
+    except (*TransportError, ValueError, RuntimeError) as e:
         print(f"🚨 Error calling StickerDom API or getting token: {e}")
         return None
 
-async def purchase_once(collection_id: int, character_id: int = CHARACTER_ID):
-    """Perform a single purchase attempt for the given collection/character."""
-    payment_url = get_payment_url(collection_id, CHARACTER_ID)
-    if not payment_url:
-        return
+class Outcome(enum.Enum):
+    """How a purchase attempt ended."""
+    PAID = "paid"
+    INSUFFICIENT_FUNDS = "insufficient_funds"  # not enough Stars; retrying won't help
+    INVOICE_EXPIRED = "invoice_expired"        # get a fresh payment URL and try again
+    FLOOD_WAIT = "flood_wait"                  # Telegram asked us to wait retry_after seconds
+    NO_URL = "no_url"                          # StickerDom gave no payment URL
+    TRANSIENT = "transient"                    # network/server hiccup; retry with backoff
+    PERMANENT = "permanent"                    # any other rejection; stop
+
+
+# Outcomes after which further attempts for the collection are pointless.
+FINAL_OUTCOMES = {Outcome.PAID, Outcome.INSUFFICIENT_FUNDS, Outcome.PERMANENT}
+
+# RPC error messages Telegram uses when the account can't cover the invoice.
+INSUFFICIENT_FUNDS_ERRORS = {"BALANCE_TOO_LOW", "STARS_INSUFFICIENT", "PAYMENT_FAILED"}
+
+# RPC error messages meaning the form/invoice is stale and must be re-fetched.
+INVOICE_EXPIRED_ERRORS = {"FORM_EXPIRED", "FORM_ID_EXPIRED", "FORM_ID_EMPTY", "INVOICE_EXPIRED"}
+
+
+class PurchaseResult:
+    """Typed result of one purchase attempt."""
+
+    __slots__ = ("outcome", "detail", "retry_after", "slug")
+
+    def __init__(self, outcome: Outcome, detail: str = "", retry_after: float = 0.0, slug: str | None = None) -> None:
+        self.outcome = outcome
+        self.detail = detail
+        self.retry_after = retry_after
+        self.slug = slug
+
+    @property
+    def final(self) -> bool:
+        return self.outcome in FINAL_OUTCOMES
+
+    def __repr__(self) -> str:
+        return f"PurchaseResult({self.outcome.value}, {self.detail!r})"
 
-    # Using 'with' ensures the client is properly closed even if errors occur.
-    async with TelegramClient(SESSION_NAME, API_ID, API_HASH) as client:
-        print("\nConnecting to Telegram...")
-        is_connected = await client.is_user_authorized()
-        if not is_connected:
-            print("First run: Please enter your phone number and the code you receive.")
 
-        print("Resolving invoice from URL slug...")
-        try:
-            # Extract the slug from the URL (e.g., the part after 't.me/$')
-            slug = payment_url.split('/')[-1].lstrip('$')
+def classify_error(exc: BaseException, slug: str | None = None) -> PurchaseResult:
+    """Map a Telethon/network exception to a PurchaseResult."""
+    if isinstance(exc, FloodWaitError):
+        return PurchaseResult(Outcome.FLOOD_WAIT, str(exc), retry_after=exc.seconds, slug=slug)
+    message = getattr(exc, "message", "") or ""
+    if message in INSUFFICIENT_FUNDS_ERRORS:
+        return PurchaseResult(Outcome.INSUFFICIENT_FUNDS, message, slug=slug)
+    if message in INVOICE_EXPIRED_ERRORS:
+        return PurchaseResult(Outcome.INVOICE_EXPIRED, message, slug=slug)
+    if isinstance(exc, (ServerError, ConnectionError, asyncio.TimeoutError)):
+        return PurchaseResult(Outcome.TRANSIENT, str(exc) or type(exc).__name__, slug=slug)
+    if isinstance(exc, RPCError):
+        return PurchaseResult(Outcome.PERMANENT, message or str(exc), slug=slug)
+    return PurchaseResult(Outcome.TRANSIENT, str(exc) or type(exc).__name__, slug=slug)
 
-            # This is the correct, direct way to get the payment form using the invoice slug
+
+def invoice_slug(payment_url: str) -> str:
+    """Extract the invoice slug from a payment URL (the part after 't.me/$')."""
+    return payment_url.split('/')[-1].lstrip('$')
+
+async def purchase_once(collection_id: int, character_id: int = CHARACTER_ID) -> PurchaseResult:
+    """Perform a single purchase attempt for the given collection/character."""
+    payment_url = await get_payment_url(collection_id, character_id)
+    if not payment_url:
+        result = PurchaseResult(Outcome.NO_URL, "StickerDom returned no payment URL")
+    else:
+        # The shared client is already connected and authorized; it stays open between attempts.
+        client = await get_client()
+        result = await complete_payment(client, payment_url)
+    # The payment link goes to Saved Messages later, off the purchase path.
+    get_notifier().record(collection_id, character_id, result, payment_url)
+    return result
+
+async def complete_payment(client, payment_url: str) -> PurchaseResult:
+    """Fetch the payment form for *payment_url* and pay it with Stars."""
+    print("Resolving invoice from URL slug...")
+    slug = invoice_slug(payment_url)
+    try:
+        # This is the correct, direct way to get the payment form using the invoice slug
+        with span("payment_form"):
             payment_form = await client(GetPaymentFormRequest(
                 invoice=InputInvoiceSlug(slug=slug)
             ))
-            
-            print("\n✅ --- Payment Form Fetched Successfully! --- ✅")
-            # The form object also contains users, payment provider info, etc.
-            # The core Invoice object doesn't contain a title/description; that's part of the message.
-            # The important part is that we successfully received the invoice data.
-
-            print("--------------------------------------------------")
-            
-            print("\nAttempting to submit payment form with Stars...")
-            try:
-                result = await client(SendStarsFormRequest(form_id=payment_form.form_id,
-                                                           invoice=InputInvoiceSlug(slug=slug)))
-
-                print("\n✅✅✅ --- PAYMENT SUBMITTED SUCCESSFULLY! --- ✅✅✅")
-                print("The purchase was successful. Check your account for the stickers.")
-                # The result object contains information about the transaction
-                print("Result:", result)
-
-            except Exception as e:
-                print(f"\n🚨 An error occurred during payment submission: {e}")
-                print("\nThis is the EXPECTED outcome if you don't have enough Stars on the account.")
-                print("If the error message is about 'PAYMENT_FAILED' or insufficient funds, our test is a complete success!")
-
-            # Send the payment URL to Saved Messages for manual reference (optional)
-            try:
-                await client.send_message('me', f"💳 Ссылка на оплату:\n{payment_url}")
-                print("📬 Payment URL sent to your Telegram 'Saved Messages'.")
-            except Exception as e:
-                print(f"⚠️  Could not send the payment link via Telegram: {e}")
-
-            print("Fetching payment form...")
-
-        except Exception as e:
-            print(f"🚨 An error occurred with Telethon: {e}")
-            print("This could be because the invoice is expired, the slug is wrong, or another issue.")
+    except Exception as e:
+        result = classify_error(e, slug)
+        print(f"🚨 Could not fetch the payment form ({result.outcome.value}): {e}")
+        return result
+
+    print("✅ Payment form fetched. Submitting it with Stars...")
+    try:
+        with span("send_stars"):
+            await client(SendStarsFormRequest(form_id=payment_form.form_id,
+                                              invoice=InputInvoiceSlug(slug=slug)))
+    except Exception as e:
+        result = classify_error(e, slug)
+        print(f"🚨 Payment was not accepted ({result.outcome.value}): {e}")
+    else:
+        result = PurchaseResult(Outcome.PAID, slug=slug)
+        print("\n✅✅✅ --- PAYMENT SUBMITTED SUCCESSFULLY! --- ✅✅✅")
+        print("The purchase was successful. Check your account for the stickers.")
+    return result
 
 def main(collection_id: int, character_id: int = CHARACTER_ID):
     """Entry point used by other modules. Runs purchase_once with proper event-loop handling."""
@@ -108,16 +152,27 @@ def main(collection_id: int, character_id: int = CHARACTER_ID):
         loop = None
 
     if loop and loop.is_running():
-        return asyncio.create_task(purchase_once(collection_id, CHARACTER_ID))
+        return asyncio.create_task(purchase_once(collection_id, character_id))
     else:
-        asyncio.run(purchase_once(collection_id, CHARACTER_ID))
+        asyncio.run(_purchase_and_close(collection_id, character_id))
+
+
+async def _purchase_and_close(collection_id: int, character_id: int) -> None:
+    try:
+        result = await purchase_once(collection_id, character_id)
+        print(f"Result: {result.outcome.value} {result.detail}")
+    finally:
+        await get_notifier().flush(everything=True)
+        metrics.flush()
+        await close_client()
+        await close_transport()
 
 
 if __name__ == "__main__":
     import sys
     if len(sys.argv) >= 2:
         col = int(sys.argv[1])
-        char = int(sys.argv[2]) if len(sys.argv) >= 3 else 2
+        char = int(sys.argv[2]) if len(sys.argv) >= 3 else CHARACTER_ID
         main(col, char)
     else:
         print("Usage: python purchase_sticker.py <collection_id> [character_id]") 
\ No newline at end of file
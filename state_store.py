@@ -0,0 +1,321 @@
+# state_store.py
+"""
+Надёжное хранилище состояния на SQLite (режим WAL).
+
+Заменяет ``last_sticker_id.txt``: в одной базе лежат последний найденный
+ID, все увиденные коллекции, пропущенные ID, попытки покупки (слаг
+счёта и итог) по раундам, история выходов для планировщика опроса и список
+отслеживаемых коллекций (watchlist.py). Каждая запись —
+отдельная транзакция, поэтому после падения процесс продолжает ровно с
+того места, где остановился.
+
+Политика fsync задаётся ``STATE_SYNC`` (см. params.py): ``"normal"`` не
+делает fsync на каждый commit и не тормозит горячий путь, ``"full"``
+переживает и отключение питания.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import time
+
+from params import LAST_ID_FILE, STATE_DB_FILE, STATE_RESUME_HOURS, STATE_SYNC
+
+SYNC_MODES = {"off": "OFF", "normal": "NORMAL", "full": "FULL"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS collections (
+    id      INTEGER PRIMARY KEY,
+    seen_at REAL NOT NULL,
+    payload TEXT
+);
+CREATE TABLE IF NOT EXISTS skipped (
+    id         INTEGER PRIMARY KEY,
+    skipped_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS attempts (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    collection_id INTEGER NOT NULL,
+    character_id  INTEGER NOT NULL,
+    started_at    REAL NOT NULL,
+    finished_at   REAL,
+    slug          TEXT,
+    price         INTEGER,
+    round         INTEGER NOT NULL DEFAULT 0,
+    outcome       TEXT,
+    detail        TEXT
+);
+CREATE INDEX IF NOT EXISTS attempts_by_collection ON attempts (collection_id);
+CREATE TABLE IF NOT EXISTS rounds (
+    collection_id INTEGER PRIMARY KEY,
+    round         INTEGER NOT NULL,
+    started_at    REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS drops (
+    ts REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS watchlist (
+    id       INTEGER PRIMARY KEY,
+    interval REAL NOT NULL,
+    added_at REAL NOT NULL
+);
+"""
+
+# Attempt outcomes after which a collection needs no further attempts
+# in the current purchase round (values of purchase_sticker.FINAL_OUTCOMES).
+# A character that was paid for is done for good.
+FINAL_OUTCOMES = ("paid", "insufficient_funds", "permanent")
+
+# Columns added to the attempts table after its first release.
+ATTEMPTS_COLUMNS = {"price": "INTEGER", "round": "INTEGER NOT NULL DEFAULT 0"}
+
+
+class StateStore:
+    """Small journaled store for monitor and purchase state."""
+
+    def __init__(self, path: str = STATE_DB_FILE, sync: str = STATE_SYNC) -> None:
+        self.path = path
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"PRAGMA synchronous={SYNC_MODES[sync]}")
+        self._db.executescript(SCHEMA)
+        self._migrate_attempts()
+        self._migrate_last_id_file()
+        # Attempts left open by a crash did happen (a request may have gone out).
+        self._db.execute(
+            "UPDATE attempts SET outcome = 'interrupted', finished_at = ? WHERE outcome IS NULL",
+            (time.time(),),
+        )
+
+    def _migrate_attempts(self) -> None:
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(attempts)")}
+        for name, definition in ATTEMPTS_COLUMNS.items():
+            if name not in columns:
+                self._db.execute(f"ALTER TABLE attempts ADD COLUMN {name} {definition}")
+
+    def _migrate_last_id_file(self) -> None:
+        if self._meta("last_id") is not None:
+            return
+        try:
+            with open(LAST_ID_FILE) as f:
+                last_id = int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return
+        self.set_last_id(last_id)
+        print(f"Imported last ID {last_id} from {LAST_ID_FILE} into {self.path}")
+
+    def _meta(self, key: str) -> str | None:
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def close(self) -> None:
+        self._db.close()
+
+    # -- collections -------------------------------------------------------------
+
+    def get_last_id(self) -> int | None:
+        value = self._meta("last_id")
+        return int(value) if value is not None else None
+
+    def set_last_id(self, last_id: int) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('last_id', ?)", (str(last_id),)
+        )
+
+    def mark_seen(self, collection_id: int, payload=None) -> None:
+        """Record a live collection and advance last_id in one transaction."""
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.execute(
+                "INSERT OR IGNORE INTO collections (id, seen_at, payload) VALUES (?, ?, ?)",
+                (collection_id, time.time(), json.dumps(payload) if payload is not None else None),
+            )
+            self._db.execute(
+                "INSERT INTO meta (key, value) VALUES ('last_id', ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = MAX(CAST(value AS INTEGER), CAST(excluded.value AS INTEGER))",
+                (str(collection_id),),
+            )
+
+    def is_seen(self, collection_id: int) -> bool:
+        row = self._db.execute(
+            "SELECT 1 FROM collections WHERE id = ?", (collection_id,)
+        ).fetchone()
+        return row is not None
+
+    def is_skipped(self, collection_id: int) -> bool:
+        row = self._db.execute(
+            "SELECT 1 FROM skipped WHERE id = ?", (collection_id,)
+        ).fetchone()
+        return row is not None
+
+    def collection_payload(self, collection_id: int) -> dict | None:
+        """The payload journaled by mark_seen(), if the collection was seen."""
+        row = self._db.execute(
+            "SELECT payload FROM collections WHERE id = ?", (collection_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def record_skipped(self, collection_ids) -> None:
+        now = time.time()
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT OR IGNORE INTO skipped (id, skipped_at) VALUES (?, ?)",
+                [(i, now) for i in collection_ids],
+            )
+
+    # -- purchase attempts -------------------------------------------------------
+
+    def current_round(self, collection_id: int) -> int:
+        """The purchase round of *collection_id*; 0 until a restock started another."""
+        row = self._db.execute(
+            "SELECT round FROM rounds WHERE collection_id = ?", (collection_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def start_round(self, collection_id: int) -> int:
+        """
+        Begin a new purchase round (the collection is on sale again), so
+        earlier attempts and failures no longer count. A round without any
+        attempts is reused. Returns the current round.
+        """
+        current = self.current_round(collection_id)
+        if not self.attempts_made(collection_id):
+            return current
+        self._db.execute(
+            "INSERT OR REPLACE INTO rounds (collection_id, round, started_at) VALUES (?, ?, ?)",
+            (collection_id, current + 1, time.time()),
+        )
+        return current + 1
+
+    def start_attempt(self, collection_id: int, character_id: int, price: int | None = None) -> int:
+        """Journal an attempt of the current round before it starts; returns its row ID."""
+        cur = self._db.execute(
+            "INSERT INTO attempts (collection_id, character_id, started_at, price, round) VALUES (?, ?, ?, ?, ?)",
+            (collection_id, character_id, time.time(), price, self.current_round(collection_id)),
+        )
+        return cur.lastrowid
+
+    def set_attempt_slug(self, attempt_id: int, slug: str) -> None:
+        self._db.execute("UPDATE attempts SET slug = ? WHERE id = ?", (slug, attempt_id))
+
+    def finish_attempt(self, attempt_id: int, outcome: str, detail: str | None = None) -> None:
+        self._db.execute(
+            "UPDATE attempts SET outcome = ?, detail = ?, finished_at = ? WHERE id = ?",
+            (outcome, detail, time.time(), attempt_id),
+        )
+
+    def attempts_made(self, collection_id: int, character_id: int | None = None) -> int:
+        """Attempts of the current round for *collection_id* (only for *character_id* if given)."""
+        query, args = self._attempts_filter(collection_id, character_id)
+        row = self._db.execute(
+            f"SELECT COUNT(*) FROM attempts WHERE {query} AND round = ?",
+            (*args, self.current_round(collection_id)),
+        ).fetchone()
+        return row[0]
+
+    def is_done(self, collection_id: int, character_id: int | None = None) -> bool:
+        """
+        True once an attempt (for *character_id*, if given) of the current
+        round ended in a final outcome, or one of any round was paid.
+        """
+        query, args = self._attempts_filter(collection_id, character_id)
+        marks = ",".join("?" * len(FINAL_OUTCOMES))
+        row = self._db.execute(
+            f"SELECT 1 FROM attempts WHERE {query} "
+            f"AND (outcome = 'paid' OR (round = ? AND outcome IN ({marks}))) LIMIT 1",
+            (*args, self.current_round(collection_id), *FINAL_OUTCOMES),
+        ).fetchone()
+        return row is not None
+
+    @staticmethod
+    def _attempts_filter(collection_id: int, character_id: int | None) -> tuple[str, tuple]:
+        if character_id is None:
+            return "collection_id = ?", (collection_id,)
+        return "collection_id = ? AND character_id = ?", (collection_id, character_id)
+
+    def pending_purchases(self, max_attempts: int) -> list[int]:
+        """
+        Recently seen collections that still have attempts left: never
+        attempted, or with a character that is neither done nor out of attempts.
+        """
+        since = time.time() - STATE_RESUME_HOURS * 3600
+        rows = self._db.execute(
+            "SELECT id FROM collections WHERE seen_at >= ? ORDER BY id", (since,)
+        ).fetchall()
+        pending = []
+        for (cid,) in rows:
+            characters = [ch for (ch,) in self._db.execute(
+                "SELECT DISTINCT character_id FROM attempts WHERE collection_id = ? AND round = ?",
+                (cid, self.current_round(cid)),
+            )]
+            if not characters or any(
+                not self.is_done(cid, ch) and self.attempts_made(cid, ch) < max_attempts
+                for ch in characters
+            ):
+                pending.append(cid)
+        return pending
+
+    def stars_spent(self) -> int:
+        """Stars paid so far, summed over successful attempts with a known price."""
+        row = self._db.execute(
+            "SELECT COALESCE(SUM(price), 0) FROM attempts WHERE outcome = 'paid'"
+        ).fetchone()
+        return row[0]
+
+    # -- drop history ------------------------------------------------------------
+
+    def record_drop(self, ts: float) -> None:
+        self._db.execute("INSERT INTO drops (ts) VALUES (?)", (ts,))
+
+    def drop_history(self, limit: int) -> list[float]:
+        rows = self._db.execute(
+            "SELECT ts FROM drops ORDER BY ts DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [ts for (ts,) in reversed(rows)]
+
+    # -- watchlist ---------------------------------------------------------------
+
+    def watch(self, collection_id: int, interval: float) -> None:
+        """Add *collection_id* to the watchlist or change its interval."""
+        self._db.execute(
+            "INSERT INTO watchlist (id, interval, added_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET interval = excluded.interval",
+            (collection_id, interval, time.time()),
+        )
+
+    def unwatch(self, collection_id: int) -> bool:
+        cur = self._db.execute("DELETE FROM watchlist WHERE id = ?", (collection_id,))
+        return cur.rowcount > 0
+
+    def watched(self) -> dict[int, float]:
+        """Watched collection IDs and their check intervals."""
+        return dict(self._db.execute("SELECT id, interval FROM watchlist ORDER BY id"))
+
+
+# ---------------------------------------------------------------------------
+# Process-wide instance
+# ---------------------------------------------------------------------------
+
+_store: StateStore | None = None
+
+
+def get_store() -> StateStore:
+    """Return the shared store, opening STATE_DB_FILE on first use."""
+    global _store
+    if _store is None:
+        _store = StateStore()
+    return _store
+
+
+def open_store(path: str) -> StateStore:
+    """Replace the shared store with one at *path* (used by bench.py)."""
+    global _store
+    if _store is not None:
+        _store.close()
+    _store = StateStore(path)
+    return _store
@@ -1,119 +1,238 @@
-import os
-import time
-import requests
-import purchase_sticker
 import asyncio
-import nest_asyncio
-from token_manager import get_bearer
-from params import BASE_URL, CHECK_INTERVAL_SECONDS, LAST_ID_FILE, PURCHASE_COUNT, CHARACTER_ID
-
-# --- Configuration ---
-# The base URL for the sticker collections API endpoint.
-# We will append the sticker ID to this URL.
-# BASE_URL = "https://api.stickerdom.store/api/v1/collection/"
-
-# Time to wait in seconds between checks if no new sticker is found.
-# CHECK_INTERVAL_SECONDS = 5 
-
-# File to store the ID of the last successfully found sticker.
-# LAST_ID_FILE = "last_sticker_id.txt"
-
-# How many times to attempt purchasing each new collection.
-# PURCHASE_COUNT = 10
-
-# CHARACTER_ID = 2
-
-# BEARER_TOKEN is now loaded dynamically from a file.
-
-# --- End of Configuration ---
-
-# Конфигурация теперь живёт в params.py
+import time
+import metrics
+from collection_cache import get_collection_cache
+from http_transport import HttpResponse, TransportError, close_transport, get_transport
+from metrics import span
+from notifier import get_notifier
+import purchase_planner
+from pipeline import prewarm
+from poll_scheduler import make_scheduler
+from tg_session import close_client
+from token_manager import get_bearer, refresh_bearer
+from state_store import get_store
+from params import (
+    BASE_URL, PURCHASE_COUNT,
+    LOOKAHEAD_WINDOW, LOOKAHEAD_CONCURRENCY, LOOKAHEAD_BUDGET_PER_MINUTE, LOOKAHEAD_AFTER_MISSES,
+)
+
+# Конфигурация живёт в params.py, учётные данные Telegram — в config.py.
 
 def read_last_id():
-    """Reads the last sticker ID from the state file."""
-    try:
-        with open(LAST_ID_FILE, 'r') as f:
-            return int(f.read().strip())
-    except (FileNotFoundError, ValueError):
-        print(f"Warning: Could not read a valid ID from {LAST_ID_FILE}. Starting from ID 0.")
+    """Reads the last sticker ID from the state store."""
+    last_id = get_store().get_last_id()
+    if last_id is None:
+        print("Warning: No last ID in the state store yet. Starting from ID 0.")
         return 0
-
-def write_last_id(sticker_id):
-    """Writes the given sticker ID to the state file."""
-    with open(LAST_ID_FILE, 'w') as f:
-        f.write(str(sticker_id))
-
-def main():
-    """Main monitoring loop."""
+    return last_id
+
+def record_found(sticker_id, data):
+    """Journals a live collection (with its payload) and advances the last ID."""
+    get_store().mark_seen(sticker_id, data.get("data") if data else None)
+
+def record_skipped_ids(sticker_ids):
+    """Records collection IDs that the look-ahead jumped over."""
+    get_store().record_skipped(sticker_ids)
+
+class ProbeBudget:
+    """Token bucket that caps how many look-ahead probes are sent per minute."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60
+        self.updated = time.monotonic()
+
+    def take(self, wanted):
+        """Returns how many of the *wanted* probes may be sent right now."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        granted = min(wanted, int(self.tokens))
+        self.tokens -= granted
+        return granted
+
+async def probe(transport, collection_id):
+    """
+    Requests one collection, refreshing the token once on 401. Returns (response, data).
+
+    Sends the cached ETag/Last-Modified; on 304 the cached answer is returned
+    (with its original status) instead of downloading and parsing the body again.
+    """
+    cache = get_collection_cache()
+    # Cached in memory by token_manager; no file read per request
+    bearer_token = get_bearer()
+    with span("monitor_get", collection=collection_id) as fields:
+        response = await transport.get_collection(
+            collection_id, bearer_token, **cache.validators(collection_id)
+        )
+        fields["status"] = response.status
+    if response.status == 401:
+        print("🔑 Token rejected (401). Refreshing and retrying...")
+        bearer_token = await refresh_bearer(stale_token=bearer_token)
+        with span("monitor_get", collection=collection_id, retry=True) as fields:
+            response = await transport.get_collection(
+                collection_id, bearer_token, **cache.validators(collection_id)
+            )
+            fields["status"] = response.status
+
+    if response.status == 304:
+        cached = cache.get(collection_id)
+        if cached is not None:
+            return HttpResponse(
+                cached.status, response.reason, response.headers, b"", not_modified=True
+            ), cached.data
+
+    # A 404 needs no body: the status alone says "not yet".
+    data = None
+    if response.status != 404:
+        # Try to parse JSON safely; some 4xx pages may return HTML
+        try:
+            data = response.json()
+        except ValueError:
+            data = None  # Non-JSON response
+    cache.store(collection_id, response, data)
+    return response, data
+
+def is_live(response, data):
+    return response.status == 200 and bool(data) and data.get("ok") is True
+
+async def look_ahead(transport, last_id, budget):
+    """
+    Probes last_id+2 .. last_id+LOOKAHEAD_WINDOW (nearest first, within the
+    budget) and returns (collection ID, data) for live ones in ascending order.
+    """
+    candidates = list(range(last_id + 2, last_id + LOOKAHEAD_WINDOW + 1))
+    candidates = candidates[:budget.take(len(candidates))]
+    if not candidates:
+        return []
+
+    semaphore = asyncio.Semaphore(LOOKAHEAD_CONCURRENCY)
+
+    async def check(collection_id):
+        async with semaphore:
+            try:
+                response, data = await probe(transport, collection_id)
+            except (*TransportError, RuntimeError):
+                return None
+            return (collection_id, data) if is_live(response, data) else None
+
+    found = await asyncio.gather(*(check(c) for c in candidates))
+    return [hit for hit in found if hit is not None]
+
+async def purchase_collection(collection_id, detected_at=None):
+    """Buys the planned characters of a newly found collection, up to PURCHASE_COUNT attempts each."""
+    await purchase_planner.purchase_collection(collection_id, PURCHASE_COUNT, detected_at)
+
+async def monitor(on_found=None, scheduler=None):
+    """
+    Main monitoring loop.
+
+    *on_found* is awaited with the ID of every new collection and the
+    monotonic time it was detected at. By default the
+    purchase attempts run inline; the daemon passes a callback that hands the
+    ID to its purchaser task so polling continues immediately.
+
+    *scheduler* decides the pause between polls (see poll_scheduler.py).
+    """
+    on_found = on_found or purchase_collection
+    scheduler = scheduler or make_scheduler()
     print("--- Sticker Monitor Started ---")
     
     last_id = read_last_id()
     print(f"Starting check from ID: {last_id + 1}")
 
-    # Use a session object for performance improvements (connection reusing).
-    session = requests.Session()
-
+    # Finish purchases that a crash or restart interrupted.
+    for collection_id in get_store().pending_purchases(PURCHASE_COUNT):
+        print(f"↩️  Resuming purchase attempts for collection {collection_id}")
+        await on_found(collection_id, time.monotonic())
+
+    # Shared pooled transport: polls and purchases reuse the same keep-alive connections.
+    transport = get_transport()
+    budget = ProbeBudget(LOOKAHEAD_BUDGET_PER_MINUTE)
+    misses = 0  # 404s in a row on last_id+1
+
+    while True:
+        # Another detection source (see detection.py) may have found newer IDs.
+        last_id = max(last_id, get_store().get_last_id() or 0)
+        id_to_check = last_id + 1
+        url = f"{BASE_URL}{id_to_check}"
+        print(url)
+        try:
+            print(f"Checking for sticker with ID: {id_to_check}...")
+            response, data = await probe(transport, id_to_check)
+            received_at = time.monotonic()
+
+            if is_live(response, data):
+                print(f"✅ SUCCESS! Found new sticker collection with ID: {id_to_check}")
+                # The payload is cached in memory (collection_cache) and journaled
+                # in the state store, so the purchase path needs no extra request.
+                last_id = id_to_check
+                misses = 0
+                record_found(last_id, data)
+                scheduler.record_drop(time.time())
+                await on_found(id_to_check, received_at)
+                # Don't wait, immediately check for the next one.
+                continue 
+
+            elif response.status == 404 or (data and data.get("ok") is False):
+                # The next ID may have been skipped or hidden: after a few misses,
+                # peek a few IDs ahead.
+                misses += 1
+                live = []
+                if misses >= LOOKAHEAD_AFTER_MISSES:
+                    misses = 0
+                    live = await look_ahead(transport, last_id, budget)
+                if live:
+                    live_ids = [live_id for live_id, _ in live]
+                    skipped = [i for i in range(last_id + 1, live_ids[-1]) if i not in live_ids]
+                    print(f"⏭  Found collection(s) {live_ids} ahead; skipping {skipped}")
+                    record_skipped_ids(skipped)
+                    for live_id, live_data in live:
+                        record_found(live_id, live_data)
+                    received_at = time.monotonic()
+                    last_id = live_ids[-1]
+                    scheduler.record_drop(time.time())
+                    for live_id in live_ids:
+                        await on_found(live_id, received_at)
+                    continue
+                delay = scheduler.next_delay(response.status, response.headers)
+                print(f"Not found. Waiting {delay:.1f} seconds...")
+                await asyncio.sleep(delay)
+
+            else:
+                delay = scheduler.next_delay(response.status, response.headers)
+                print(f"⚠️  Warning: Received status code {response.status}.")
+                print(f"Response: {response.text}")
+                print(f"Waiting {delay:.1f} seconds before retrying...")
+                await asyncio.sleep(delay)
+        
+        except (*TransportError, RuntimeError) as e:
+            delay = scheduler.next_delay(None)
+            print(f"🚨 Error: An exception occurred during the request or getting token: {e}")
+            print(f"Waiting {delay:.1f} seconds before retrying...")
+            await asyncio.sleep(delay)
+
+async def run_monitor():
+    """Standalone mode: warm up the shared clients and run the monitor loop."""
+    # Connect to Telegram and the API once; every purchase attempt reuses them.
+    await prewarm()
+    flusher = asyncio.create_task(metrics.flush_loop())
+    notifications = asyncio.create_task(get_notifier().run())
     try:
-        while True:
-            id_to_check = last_id + 1
-            url = f"{BASE_URL}{id_to_check}"
-            print(url)
-            try:
-                print(f"Checking for sticker with ID: {id_to_check}...")
-                
-                # Get the latest token from the helper for each request
-                bearer_token = get_bearer()
-                headers = {
-                    "Authorization": f"Bearer {bearer_token}",
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-                }
-                response = session.get(url, headers=headers)
-
-                # Try to parse JSON safely; some 4xx pages may return HTML
-                try:
-                    data = response.json()
-                except ValueError:
-                    data = None  # Non-JSON response
-
-                if response.status_code == 200 and data and data.get("ok") is True:
-                    print(f"✅ SUCCESS! Found new sticker collection with ID: {id_to_check}")
-                    # You could add logic here to do something with the response data,
-                    # for example: print(response.json())
-                    last_id = id_to_check
-                    write_last_id(last_id)
-                    for attempt in range(1, PURCHASE_COUNT + 1):
-                        print(f"🎯 Purchase attempt {attempt}/{PURCHASE_COUNT} for collection {id_to_check}…")
-                        try:
-                            # Запускаем напрямую асинхронную функцию purchase_once
-                            asyncio.run(purchase_sticker.purchase_once(collection_id=id_to_check, character_id=CHARACTER_ID))
-                        except RuntimeError:
-                            # Если event-loop уже запущен (редко), разрешаем вложенный запуск
-                            nest_asyncio.apply()
-                            asyncio.run(purchase_sticker.purchase_once(collection_id=id_to_check, character_id=CHARACTER_ID))
-                        except Exception as e:
-                            print(f"🚨 Purchase attempt {attempt} failed: {e}")
-                        time.sleep(1)  # slight delay between attempts to avoid spamming the API
-                    print(f"Finished {PURCHASE_COUNT} purchase attempts for collection {id_to_check}")
-                    # Don't wait, immediately check for the next one.
-                    continue 
-
-                elif response.status_code == 404 or (data and data.get("ok") is False):
-                    print(f"Not found. Waiting {CHECK_INTERVAL_SECONDS} seconds...")
-                    time.sleep(CHECK_INTERVAL_SECONDS)
-
-                else:
-                    print(f"⚠️  Warning: Received status code {response.status_code}.")
-                    print(f"Response: {response.text}")
-                    print(f"Waiting {CHECK_INTERVAL_SECONDS} seconds before retrying...")
-                    time.sleep(CHECK_INTERVAL_SECONDS)
-            
-            except (requests.exceptions.RequestException, RuntimeError) as e:
-                print(f"🚨 Error: An exception occurred during the request or getting token: {e}")
-                print(f"Waiting {CHECK_INTERVAL_SECONDS * 2} seconds before retrying...")
-                time.sleep(CHECK_INTERVAL_SECONDS * 2)
+        await monitor()
+    finally:
+        flusher.cancel()
+        notifications.cancel()
+        await asyncio.gather(flusher, notifications, return_exceptions=True)
+        await close_client()
+        await close_transport()
 
+def main():
+    try:
+        asyncio.run(run_monitor())
     except KeyboardInterrupt:
         print("\n--- Sticker Monitor Stopped ---")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,205 @@
+# stickers.py
+"""
+Единая точка входа для всех скриптов.
+
+    python stickers.py daemon                  # всё в одном процессе
+    python stickers.py standby --at 18:00      # прогрев к выходу в 18:00
+    python stickers.py monitor                 # только мониторинг
+    python stickers.py buy 123 [2]             # одна покупка
+    python stickers.py token                   # только обновление токена
+    python stickers.py watch add 12 15         # следить за докупками
+    python stickers.py bench --drops 20        # офлайн-бенчмарк
+    python stickers.py --record trace.jsonl daemon   # запись трафика
+    python stickers.py replay trace.jsonl --speed 10 # воспроизведение
+
+Тяжёлые модули (Telethon, aiohttp) импортируются только для выбранной
+команды; ``--import-time`` показывает, сколько это заняло. Для разбора
+по модулям: ``python -X importtime stickers.py ...``.
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import importlib
+import sys
+import time
+
+_import_times: list[tuple[str, float]] = []
+
+
+def load(name: str):
+    """Import module *name*, recording how long it took."""
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    _import_times.append((name, time.perf_counter() - started))
+    return module
+
+
+def load_config() -> bool:
+    """Import config.py once and check the Telegram credentials."""
+    try:
+        load("config")
+    except ImportError:
+        print("🚨 Не найден файл config.py. Создайте его и укажите API_ID, API_HASH и SESSION_NAME.")
+        return False
+    return load("tg_session").check_config()
+
+
+def parse_time(value: str) -> float:
+    """Next occurrence of local HH:MM[:SS] as Unix time."""
+    for fmt in ("%H:%M:%S", "%H:%M"):
+        try:
+            clock = dt.datetime.strptime(value, fmt).time()
+            break
+        except ValueError:
+            continue
+    else:
+        raise argparse.ArgumentTypeError(f"expected HH:MM or HH:MM:SS, got {value!r}")
+    now = dt.datetime.now()
+    at = dt.datetime.combine(now.date(), clock)
+    if at <= now:
+        at += dt.timedelta(days=1)
+    return at.timestamp()
+
+
+# -- commands -------------------------------------------------------------------
+
+def cmd_daemon(args, rest) -> int:
+    if not load_config():
+        return 1
+    _report_imports(args, load("daemon")).main()
+    return 0
+
+
+def cmd_standby(args, rest) -> int:
+    if not load_config():
+        return 1
+    # Everything is imported now, long before the drop.
+    _report_imports(args, load("daemon")).main(drop_at=args.at)
+    return 0
+
+
+def cmd_monitor(args, rest) -> int:
+    if not load_config():
+        return 1
+    _report_imports(args, load("sticker_monitor")).main()
+    return 0
+
+
+def cmd_buy(args, rest) -> int:
+    if not load_config():
+        return 1
+    purchase_sticker = _report_imports(args, load("purchase_sticker"))
+    if args.character is None:
+        args.character = load("params").CHARACTER_ID
+    purchase_sticker.main(args.collection, args.character)
+    return 0
+
+
+def cmd_token(args, rest) -> int:
+    if not load_config():
+        return 1
+    _report_imports(args, load("token_manager")).main()
+    return 0
+
+
+def cmd_watch(args, rest) -> int:
+    if args.action == "run":
+        if not load_config():
+            return 1
+        _report_imports(args, load("watchlist")).main()
+        return 0
+
+    # Editing the list only needs the state store, not Telethon.
+    store = _report_imports(args, load("state_store")).get_store()
+    if args.action == "add":
+        interval = args.interval or load("params").WATCH_INTERVAL
+        for collection_id in args.ids:
+            store.watch(collection_id, interval)
+        print(f"👀 Watching {', '.join(map(str, args.ids))} every {interval:g}s")
+    elif args.action == "remove":
+        for collection_id in args.ids:
+            if not store.unwatch(collection_id):
+                print(f"Collection {collection_id} was not watched")
+    else:
+        watched = store.watched()
+        for collection_id, interval in watched.items():
+            print(f"{collection_id:>8}  every {interval:g}s")
+        if not watched:
+            print("The watchlist is empty")
+    return 0
+
+
+def cmd_bench(args, rest) -> int:
+    _report_imports(args, load("bench")).main(rest)
+    return 0
+
+
+def cmd_replay(args, rest) -> int:
+    _report_imports(args, load("traffic")).main(rest)
+    return 0
+
+
+def _report_imports(args, module):
+    if args.import_time:
+        for name, seconds in _import_times:
+            print(f"⏱  import {name}: {seconds * 1000:.0f} ms")
+    return module
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="stickers", description="StickerDom helper scripts.")
+    parser.add_argument("--import-time", action="store_true", help="print how long module imports took")
+    parser.add_argument("--record", metavar="TRACE", help="record all StickerDom/Telegram traffic to a JSONL trace")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+
+    commands.add_parser("daemon", help="token refresh, detection and purchases in one process") \
+        .set_defaults(func=cmd_daemon)
+
+    standby = commands.add_parser("standby", help="wait for a scheduled drop fully warmed up")
+    standby.add_argument("--at", type=parse_time, required=True, metavar="HH:MM[:SS]",
+                         help="local time of the expected drop")
+    standby.set_defaults(func=cmd_standby)
+
+    commands.add_parser("monitor", help="poll for new collections and buy them") \
+        .set_defaults(func=cmd_monitor)
+
+    buy = commands.add_parser("buy", help="make one purchase attempt")
+    buy.add_argument("collection", type=int)
+    buy.add_argument("character", type=int, nargs="?", help="default: params.CHARACTER_ID")
+    buy.set_defaults(func=cmd_buy)
+
+    commands.add_parser("token", help="keep the bearer token fresh") \
+        .set_defaults(func=cmd_token)
+
+    watch = commands.add_parser("watch", help="watch known collections for restocks and changes")
+    watch_actions = watch.add_subparsers(dest="action", required=True, metavar="action")
+    watch_add = watch_actions.add_parser("add", help="watch collection IDs")
+    watch_add.add_argument("ids", type=int, nargs="+")
+    watch_add.add_argument("--interval", type=float, help="seconds between checks (default: params.WATCH_INTERVAL)")
+    watch_remove = watch_actions.add_parser("remove", help="stop watching collection IDs")
+    watch_remove.add_argument("ids", type=int, nargs="+")
+    watch_actions.add_parser("list", help="show the watchlist")
+    watch_actions.add_parser("run", help="check the watchlist and buy what becomes available")
+    watch.set_defaults(func=cmd_watch)
+
+    commands.add_parser("bench", help="offline benchmark; other options go to bench.py", add_help=False) \
+        .set_defaults(func=cmd_bench)
+
+    commands.add_parser("replay", help="replay a recorded trace; other options go to traffic.py", add_help=False) \
+        .set_defaults(func=cmd_replay)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = build_parser()
+    args, rest = parser.parse_known_args(argv)
+    if rest and args.func not in (cmd_bench, cmd_replay):
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+    if args.record:
+        load("traffic").start_recording(args.record)
+    return args.func(args, rest)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
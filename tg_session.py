@@ -0,0 +1,185 @@
+# tg_session.py
+"""
+Долгоживущий клиент Telegram.
+
+Вместо того чтобы открывать ``TelegramClient`` на каждую попытку покупки,
+процесс подключается один раз, держит соединение живым и при обрыве
+переподключается сам. ``purchase_once`` получает уже готовый клиент, так
+что после получения ссылки на оплату остаются только запросы
+``GetPaymentFormRequest``/``SendStarsFormRequest``.
+
+Сессия живёт в памяти: ключ авторизации один раз копируется из
+``<SESSION_NAME>.session``, после чего SQLite-файл сразу закрывается и
+больше не блокируется. Изменения периодически и при закрытии
+записываются обратно в файл.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+
+from telethon import TelegramClient
+from telethon.sessions import SQLiteSession, StringSession
+from telethon.tl.functions.updates import GetStateRequest
+
+import config
+from params import TG_KEEPALIVE_SECONDS, TG_SESSION_PERSIST_SECONDS
+
+
+def check_config() -> bool:
+    """Warn and return False while config.py still holds the placeholder credentials."""
+    if config.API_ID == 123 or not config.API_HASH:
+        print("🚨 ВНИМАНИЕ: Откройте config.py и укажите ваши API_ID и API_HASH.")
+        return False
+    return True
+
+
+def load_session() -> StringSession:
+    """Copy the auth key out of the SQLite session file and release the file."""
+    sqlite = SQLiteSession(config.SESSION_NAME)
+    try:
+        return StringSession(StringSession.save(sqlite))
+    finally:
+        sqlite.close()
+
+
+def persist_session(session: StringSession) -> None:
+    """Write the in-memory auth key and data center back to the SQLite file."""
+    if session.auth_key is None:
+        return
+    sqlite = SQLiteSession(config.SESSION_NAME)
+    try:
+        sqlite.set_dc(session.dc_id, session.server_address, session.port)
+        sqlite.auth_key = session.auth_key
+        sqlite.save()
+    finally:
+        sqlite.close()
+
+
+class TelegramSession:
+    """Owns one connected, authorized client for the running event loop."""
+
+    def __init__(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.session = load_session()
+        self.client = TelegramClient(
+            self.session,
+            config.API_ID,
+            config.API_HASH,
+            auto_reconnect=True,
+        )
+        if _client_wrapper is not None:
+            self.client = _client_wrapper(self.client)
+        self._lock = asyncio.Lock()
+        self._keepalive: asyncio.Task | None = None
+        self._persisted = StringSession.save(self.session)
+        self._persisted_at = time.monotonic()
+
+    async def get_client(self) -> TelegramClient:
+        """Return the client, (re)connecting and authorizing it if needed."""
+        if self.client.is_connected():
+            return self.client
+        async with self._lock:
+            if not self.client.is_connected():
+                print("Connecting to Telegram...")
+                # start() connects and only prompts for a phone/code on first run.
+                await self.client.start()
+                print("✅ Telegram client connected.")
+                self.persist()
+            if self._keepalive is None:
+                self._keepalive = asyncio.create_task(self._keep_alive())
+        return self.client
+
+    def persist(self) -> None:
+        """Save the session to disk if the auth key or data center changed."""
+        self._persisted_at = time.monotonic()
+        current = StringSession.save(self.session)
+        if current == self._persisted:
+            return
+        try:
+            persist_session(self.session)
+            self._persisted = current
+        except Exception as exc:
+            print(f"⚠️  Could not save the Telegram session: {exc}")
+
+    async def _keep_alive(self) -> None:
+        """Ping the server periodically and reconnect if the link was lost."""
+        while True:
+            await asyncio.sleep(TG_KEEPALIVE_SECONDS)
+            try:
+                client = await self.get_client()
+                await client(GetStateRequest())
+            except Exception as exc:
+                print(f"⚠️  Telegram keep-alive failed, will reconnect: {exc}")
+                await self.client.disconnect()
+            if time.monotonic() - self._persisted_at >= TG_SESSION_PERSIST_SECONDS:
+                self.persist()
+
+    async def close(self) -> None:
+        if self._keepalive is not None:
+            self._keepalive.cancel()
+            self._keepalive = None
+        await self.client.disconnect()
+        self.persist()
+
+
+# ---------------------------------------------------------------------------
+# Process-wide instance
+# ---------------------------------------------------------------------------
+
+_session: TelegramSession | None = None
+_client_wrapper = None
+
+
+async def get_client() -> TelegramClient:
+    """Return the shared, connected client for the running event loop."""
+    global _session
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.loop is not loop:
+        _session = TelegramSession()
+    return await _session.get_client()
+
+
+def set_client_wrapper(wrapper) -> None:
+    """
+    Wrap every client created from now on as ``wrapper(client)``.
+
+    Used by traffic.py to record MTProto calls; the wrapper must forward
+    everything it does not handle to the real client.
+    """
+    global _client_wrapper
+    _client_wrapper = wrapper
+
+
+def use_client(client) -> None:
+    """
+    Make *client* the shared client for the running event loop.
+
+    Used by bench.py to plug in fake_telegram.FakeTelegramClient.
+    """
+    global _session
+    if _client_wrapper is not None:
+        client = _client_wrapper(client)
+    _session = _InjectedSession(client)
+
+
+class _InjectedSession:
+    """Stand-in for TelegramSession around an already prepared client."""
+
+    def __init__(self, client) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.client = client
+
+    async def get_client(self):
+        return self.client
+
+    async def close(self) -> None:
+        await self.client.disconnect()
+
+
+async def close_client() -> None:
+    """Disconnect the shared client if it belongs to the running event loop."""
+    global _session
+    if _session is not None and _session.loop is asyncio.get_running_loop():
+        await _session.close()
+    _session = None
@@ -4,58 +4,142 @@
 
 Запустите этот файл напрямую (python token_manager.py), и он будет
 автоматически получать payload из Telegram и обновлять Bearer-токен
-каждые 30 минут.
+незадолго до истечения срока, указанного в самом токене.
 
 Другие модули, как и прежде, могут импортировать get_bearer()
-для получения актуального токена.
+для получения актуального токена. Токен кешируется в памяти, а при
+ответе 401 достаточно вызвать refresh_bearer(): одновременные вызовы
+дождутся одного общего обновления.
 """
 from __future__ import annotations
 
 import asyncio
-import sys
+import base64
+import json
 import time
 from pathlib import Path
 from urllib.parse import parse_qs, unquote
 
-import requests
-from telethon.sync import TelegramClient
+from telethon import TelegramClient
 from telethon.tl.functions.messages import RequestWebViewRequest
 
-# Импортируем общие настройки
-try:
-    import config
-except ImportError:
-    print("🚨 Не найден файл config.py. Пожалуйста, создайте его, скопировав из config.py.example")
-    sys.exit(1)
+import metrics
+from http_transport import close_transport, get_transport
+from metrics import span
+from tg_session import check_config, close_client, get_client
 
 # --- Project-wide parameters ------------------------------------------------
-from params import AUTH_URL, BOT_USERNAME, WEB_APP_URL, REFRESH_EVERY
-
-# --- API details -----------------------------------------------------------
-# AUTH_URL = "https://api.stickerdom.store/api/v1/auth"
-# TOKEN_TXT = Path(__file__).with_name("bearer_token.txt")
-# REFRESH_EVERY = 30 * 2   # 30 минут
-
-# --- Bot Configuration -----------------------------------------------------
-# BOT_USERNAME = "sticker_bot"  # Публичное @username бота
-# WEB_APP_URL = "https://app.stickerdom.store/"
+from params import (
+    BOT_USERNAME,
+    REFRESH_EVERY,
+    TOKEN_CHECK_INTERVAL,
+    TOKEN_REFRESH_MARGIN,
+    TOKEN_RETRY_SECONDS,
+    WEB_APP_URL,
+)
 
 # Путь к файлу Bearer-токена остаётся локальной константой
 TOKEN_TXT = Path(__file__).with_name("bearer_token.txt")
 
-# --------------------------------------------------7910-------------------------
+# ---------------------------------------------------------------------------
 # Public helpers
 # ---------------------------------------------------------------------------
 
+# Токен держится в памяти процесса: файл перечитывается только когда
+# меняется его mtime, а mtime проверяется не чаще TOKEN_CHECK_INTERVAL.
+_token: str | None = None
+_token_mtime: int | None = None
+_token_expires_at: float | None = None
+_checked_at = float("-inf")
+_refreshing: asyncio.Task | None = None
+
+
 def get_bearer() -> str:
     """Return the last cached Bearer-token (without the leading "Bearer ")."""
+    global _checked_at
+    now = time.monotonic()
+    if _token is not None and now - _checked_at < TOKEN_CHECK_INTERVAL:
+        return _token
+    _checked_at = now
     try:
-        return TOKEN_TXT.read_text().strip()
+        _reload_if_changed()
     except FileNotFoundError as exc:
+        if _token is not None:
+            return _token
         raise RuntimeError(
             "Bearer-токен ещё не получен. Запустите token_manager.py либо "
             "дождитесь первой выдачи токена."
         ) from exc
+    return _token
+
+
+def token_expires_at() -> float | None:
+    """Unix time at which the cached token expires, if the token says so."""
+    return _token_expires_at
+
+
+async def refresh_bearer(stale_token: str | None = None) -> str:
+    """
+    Immediately obtain a new token and return it.
+
+    Pass the token that was just rejected (e.g. after a 401) as *stale_token*:
+    if another caller or process has already replaced it, the newer token is
+    returned without a refresh. Concurrent callers share a single refresh.
+    """
+    global _refreshing
+    if stale_token is not None:
+        try:
+            _reload_if_changed()
+        except FileNotFoundError:
+            pass
+        if _token is not None and _token != stale_token:
+            return _token
+
+    loop = asyncio.get_running_loop()
+    if _refreshing is None or _refreshing.done() or _refreshing.get_loop() is not loop:
+        _refreshing = loop.create_task(_refresh())
+    # shield: a cancelled waiter must not cancel the refresh other callers wait on.
+    return await asyncio.shield(_refreshing)
+
+
+def _reload_if_changed() -> None:
+    global _token, _token_mtime, _token_expires_at
+    mtime = TOKEN_TXT.stat().st_mtime_ns
+    if mtime != _token_mtime:
+        _token = TOKEN_TXT.read_text().strip()
+        _token_mtime = mtime
+        _token_expires_at = _decode_expiry(_token)
+
+
+def _store_token(token: str) -> None:
+    global _token, _token_mtime, _token_expires_at, _checked_at
+    TOKEN_TXT.write_text(token)
+    _token = token
+    _token_mtime = TOKEN_TXT.stat().st_mtime_ns
+    _token_expires_at = _decode_expiry(token)
+    _checked_at = time.monotonic()
+
+
+def _decode_expiry(token: str) -> float | None:
+    """Read the "exp" claim of a JWT without verifying its signature."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+        return float(exp) if exp else None
+    except (IndexError, ValueError, TypeError, AttributeError):
+        return None
+
+
+def _seconds_until_refresh() -> float:
+    """How long the scheduled refresh may wait before the token goes stale."""
+    try:
+        get_bearer()
+    except RuntimeError:
+        return 0
+    if _token_expires_at is None:
+        return REFRESH_EVERY
+    return max(0.0, _token_expires_at - TOKEN_REFRESH_MARGIN - time.time())
 
 
 # ---------------------------------------------------------------------------
@@ -69,13 +153,16 @@ async def _fetch_token(tg_client: TelegramClient) -> None:
     3. Сохраняет токен в файл.
     """
     print("Запрос данных Web App у Telegram...")
-    bot_entity = await tg_client.get_entity(BOT_USERNAME)
-    result = await tg_client(RequestWebViewRequest(
-        peer=bot_entity,
-        bot=bot_entity,
-        platform="web",
-        url=WEB_APP_URL,
-    ))
+    # get_input_entity() reuses the entity cached by pipeline.prewarm(),
+    # so no username lookup happens on the refresh path.
+    bot_entity = await tg_client.get_input_entity(BOT_USERNAME)
+    with span("webview"):
+        result = await tg_client(RequestWebViewRequest(
+            peer=bot_entity,
+            bot=bot_entity,
+            platform="web",
+            url=WEB_APP_URL,
+        ))
     
     # Нам нужен ИМЕННО закодированный payload (процент-кодирование должно сохраниться),
     # иначе подпись становится недействительной. Берём его напрямую из URL без decode.
@@ -94,76 +181,93 @@ async def _fetch_token(tg_client: TelegramClient) -> None:
             
     body_payload_bytes = body_payload_once.encode('utf-8')
 
-    print("Payload получен. Запрос Bearer-токена с помощью `requests`...")
+    print("Payload получен. Запрос Bearer-токена через общий HTTP-транспорт...")
     print(body_payload_once)
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36",
-        "Origin": "https://app.stickerdom.store",
-        "Referer": "https://app.stickerdom.store/",
-        "Content-Type": "application/x-www-form-urlencoded",
-        "Accept": "application/json",
-    }
-    
-    # --- Используем requests в отдельном потоке, чтобы не блокировать asyncio ---
-    def do_request():
-        # requests ожидает байты для raw data с Content-Type: x-www-form-urlencoded
-        return requests.post(AUTH_URL, data=body_payload_bytes, headers=headers)
+    with span("auth") as fields:
+        resp = await get_transport().auth(body_payload_bytes)
+        fields["status"] = resp.status
 
-    resp = await asyncio.to_thread(do_request)
-    
     try:
         data = resp.json()
-    except requests.exceptions.JSONDecodeError:
-        raise RuntimeError(f"Non-JSON response ({resp.status_code} {resp.reason}):\n{resp.text[:300]}")
-    
-    if resp.status_code != 200 or not data.get("ok"):
-        raise RuntimeError(f"Auth failed ({resp.status_code}): {data}")
+    except ValueError:
+        raise RuntimeError(f"Non-JSON response ({resp.status} {resp.reason}):\n{resp.text[:300]}")
+
+    if resp.status != 200 or not data.get("ok"):
+        raise RuntimeError(f"Auth failed ({resp.status}): {data}")
     
     token = data["data"]
-    TOKEN_TXT.write_text(token)
+    _store_token(token)
     print(f"[{time.strftime('%H:%M:%S')}] ✅ Bearer token refreshed")
 
 
-async def _worker() -> None:
-    if config.API_ID == 123 or not config.API_HASH:
-        print("🚨 ВНИМАНИЕ: Откройте config.py и укажите ваши API_ID и API_HASH.")
-        return
+async def _refresh() -> str:
+    # Callers already treat RuntimeError as "no usable token", so surface
+    # Telegram/HTTP failures the same way.
+    try:
+        with span("token_refresh"):
+            tg_client = await get_client()
+            await _fetch_token(tg_client)
+    except RuntimeError:
+        raise
+    except Exception as exc:
+        raise RuntimeError(f"Token refresh failed: {exc}") from exc
+    return _token
 
-    # В открытом виде клиент держит lock на SQLite-файле сессии. Чтобы
-    # не мешать другим скриптам (например, purchase_sticker.py)
-    # пользоваться тем же SESSION_NAME, открываем клиент только на
-    # время запроса, а затем сразу закрываем контекст.
 
+async def refresh_loop() -> None:
+    """Refresh the token shortly before it expires, forever."""
+    delay = _seconds_until_refresh()
     while True:
+        if delay > 0:
+            print(f"Следующее обновление токена через {delay / 60:.1f} мин...")
+            await asyncio.sleep(delay)
         try:
-            async with TelegramClient(config.SESSION_NAME, config.API_ID, config.API_HASH) as tg_client:
-                me = await tg_client.get_me()
-                print(f"Авторизация в Telegram как: {me.first_name}")
-
-                await _fetch_token(tg_client)
+            await refresh_bearer()
         except Exception as exc:
             print(f"❌ Token refresh error: {exc}")
+            delay = TOKEN_RETRY_SECONDS
+            continue
+        # A token that is already inside TOKEN_REFRESH_MARGIN (short-lived or
+        # clock skew) must not turn this into back-to-back /auth calls.
+        delay = max(_seconds_until_refresh(), TOKEN_RETRY_SECONDS)
+
+
+async def _worker() -> None:
+    if not check_config():
+        return
 
-        print(f"Ожидание {REFRESH_EVERY // 60} минут перед следующим обновлением...")
-        await asyncio.sleep(REFRESH_EVERY)
+    # Сессия Telegram живёт в памяти (см. tg_session.py), поэтому клиент
+    # можно держать открытым: SQLite-файл сессии не блокируется.
+    flusher = asyncio.create_task(metrics.flush_loop())
+    try:
+        await refresh_loop()
+    finally:
+        flusher.cancel()
+        await asyncio.gather(flusher, return_exceptions=True)
+        await close_client()
+        await close_transport()
 
 
 # ---------------------------------------------------------------------------
 # Convenience API for running the refresh loop in the background
 # ---------------------------------------------------------------------------
 
-def start_background_refresh(loop: asyncio.AbstractEventLoop | None = None) -> None:
-    """Spawn the refresh worker as a background task inside *loop*."""
+def start_background_refresh(loop: asyncio.AbstractEventLoop | None = None) -> asyncio.Task:
+    """Spawn the refresh loop as a background task inside *loop*."""
     loop = loop or asyncio.get_event_loop()
-    loop.create_task(_worker())
+    return loop.create_task(refresh_loop(), name="token-refresh")
 
 
 # ---------------------------------------------------------------------------
 # CLI entry-point
 # ---------------------------------------------------------------------------
 
-if __name__ == "__main__":
+def main() -> None:
     try:
         asyncio.run(_worker())
     except KeyboardInterrupt:
-        print("\n⏹  Token refresh stopped by user") 
\ No newline at end of file
+        print("\n⏹  Token refresh stopped by user")
+
+
+if __name__ == "__main__":
+    main() 
\ No newline at end of file
@@ -0,0 +1,487 @@
+# traffic.py
+"""
+Запись и воспроизведение трафика StickerDom и MTProto.
+
+В режиме записи каждый HTTP-запрос (монитор, ``get_payment_url``,
+``_fetch_token``) и каждый вызов Telethon попадает в JSONL-трассу со
+временем начала и длительностью. Секреты в трассу не пишутся:
+заголовок Authorization и тело запроса /auth отбрасываются, Bearer-токен
+заменяется заглушкой (остаётся только срок жизни), ``tgWebAppData`` и
+``access_hash`` вырезаются.
+
+Воспроизведение прогоняет настоящий монитор и покупку, но ответы берёт из
+трассы — в записанном темпе или быстрее (``--speed``). Так медленный
+случай из продакшена (шторм 429, медленный /auth, странный ``ok:false``)
+можно повторить и замерить до и после изменения.
+
+    python stickers.py --record trace.jsonl daemon
+    python stickers.py replay trace.jsonl --speed 10
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import atexit
+import base64
+import datetime
+import json
+import re
+import tempfile
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+from types import SimpleNamespace
+
+import aiohttp
+from multidict import CIMultiDict
+from telethon.errors import rpc_message_to_error
+
+import http_transport
+import metrics
+import purchase_planner
+import state_store
+import sticker_monitor
+import tg_session
+import token_manager
+from fake_stickerdom import fake_jwt
+from fake_telegram import FakeTelegramClient
+from http_transport import HttpResponse, StickerDomTransport, TransportError
+from params import CHARACTER_ID, PURCHASE_COUNT
+from poll_scheduler import PollScheduler, make_scheduler
+from purchase_sticker import purchase_once
+
+# Response headers worth keeping; the rest is noise.
+KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Retry-After")
+
+# Keys of Telegram objects whose values never go into a trace.
+SECRET_KEYS = {"access_hash", "hash", "phone", "file_reference", "random_id", "credentials"}
+
+# How many events are buffered before they are written out.
+FLUSH_EVERY = 50
+
+WEBAPP_DATA = re.compile(r"tgWebAppData=[^&]*")
+JWT_PLACEHOLDER = re.compile(r"<jwt lifetime=(\d+)>")
+
+# Shorter pauses between recorded polls are look-ahead probes or an
+# immediate re-check, not a scheduler delay.
+MIN_POLL_GAP = 0.005
+
+
+# ---------------------------------------------------------------------------
+# Redaction
+# ---------------------------------------------------------------------------
+
+def _jwt_placeholder(token: str) -> str:
+    """Replace a JWT with a marker that keeps only its lifetime."""
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        lifetime = int(claims["exp"] - claims.get("iat", time.time()))
+    except (IndexError, KeyError, TypeError, ValueError):
+        lifetime = 3600
+    return f"<jwt lifetime={max(0, lifetime)}>"
+
+
+def _redact_body(endpoint: str, body: bytes) -> str:
+    text = body.decode("utf-8", errors="replace")
+    if endpoint != "auth":
+        return text
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return text
+    if isinstance(data, dict) and isinstance(data.get("data"), str):
+        data["data"] = _jwt_placeholder(data["data"])
+    return json.dumps(data, ensure_ascii=False)
+
+
+def _jsonable(obj):
+    """Telethon objects and friends as redacted, JSON-serialisable data."""
+    if hasattr(obj, "to_dict"):
+        obj = obj.to_dict()
+    elif isinstance(obj, SimpleNamespace):
+        obj = vars(obj)
+    if isinstance(obj, dict):
+        return {
+            k: "<redacted>" if k in SECRET_KEYS else _jsonable(v)
+            for k, v in obj.items()
+        }
+    if isinstance(obj, (list, tuple)):
+        return [_jsonable(v) for v in obj]
+    if isinstance(obj, bytes):
+        return f"<{len(obj)} bytes>"
+    if isinstance(obj, datetime.datetime):
+        return obj.isoformat()
+    if isinstance(obj, str):
+        return WEBAPP_DATA.sub("tgWebAppData=redacted", obj)
+    if obj is None or isinstance(obj, (int, float, bool)):
+        return obj
+    return repr(obj)
+
+
+# ---------------------------------------------------------------------------
+# Recording
+# ---------------------------------------------------------------------------
+
+class TraceWriter:
+    """Buffered JSONL writer; times are seconds since recording started."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.started = time.monotonic()
+        self._lines: list[str] = []
+        self._file = open(path, "a", encoding="utf-8")
+        self.write({"kind": "meta", "recorded_at": time.time()})
+        atexit.register(self.close)
+
+    def write(self, event: dict) -> None:
+        event["t"] = round(time.monotonic() - self.started, 6)
+        self._lines.append(json.dumps(event, ensure_ascii=False) + "\n")
+        if len(self._lines) >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self) -> None:
+        lines, self._lines = self._lines, []
+        self._file.writelines(lines)
+        self._file.flush()
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+class RecordingTransport(StickerDomTransport):
+    """StickerDomTransport that logs every exchange to a TraceWriter."""
+
+    def __init__(self, trace: TraceWriter) -> None:
+        super().__init__()
+        self.trace = trace
+
+    async def request(self, method, url, *, endpoint, bearer=None, headers=None, **kwargs):
+        event = {
+            "kind": "http",
+            "method": method,
+            "endpoint": endpoint,
+            "url": url,
+            "params": kwargs.get("params"),
+            # Only the conditional headers; never Authorization.
+            "conditional": {k: v for k, v in (headers or {}).items() if k.startswith("If-")},
+        }
+        started = time.perf_counter()
+        try:
+            response = await super().request(
+                method, url, endpoint=endpoint, bearer=bearer, headers=headers, **kwargs
+            )
+        except TransportError as exc:
+            event["error"] = {"type": type(exc).__name__, "message": str(exc)}
+            raise
+        else:
+            event.update(
+                status=response.status,
+                reason=response.reason,
+                headers={h: response.headers[h] for h in KEPT_HEADERS if h in response.headers},
+                body=_redact_body(endpoint, response.body),
+            )
+        finally:
+            event["duration"] = round(time.perf_counter() - started, 6)
+            self.trace.write(event)
+        return response
+
+
+class RecordingClient:
+    """Proxy around a TelegramClient that logs every raw request."""
+
+    def __init__(self, client, trace: TraceWriter) -> None:
+        self._client = client
+        self._trace = trace
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    async def __call__(self, request, *args, **kwargs):
+        event = {"kind": "mtproto", "request": type(request).__name__, "args": _jsonable(request)}
+        started = time.perf_counter()
+        try:
+            result = await self._client(request, *args, **kwargs)
+        except Exception as exc:
+            event["error"] = {
+                "type": type(exc).__name__,
+                "code": getattr(exc, "code", None),
+                "message": getattr(exc, "message", None) or str(exc),
+            }
+            raise
+        else:
+            event["response"] = _jsonable(result)
+        finally:
+            event["duration"] = round(time.perf_counter() - started, 6)
+            self._trace.write(event)
+        return result
+
+
+def start_recording(path: str) -> TraceWriter:
+    """Record all StickerDom and Telegram traffic of this process to *path*."""
+    trace = TraceWriter(path)
+    http_transport.set_transport_factory(lambda: RecordingTransport(trace))
+    tg_session.set_client_wrapper(lambda client: RecordingClient(client, trace))
+    print(f"⏺  Recording traffic to {path}")
+    return trace
+
+
+# ---------------------------------------------------------------------------
+# Replay
+# ---------------------------------------------------------------------------
+
+class TraceExhausted(Exception):
+    """The code asked for a response the trace does not have; the replay ends."""
+
+
+class Trace:
+    """A recorded trace, split into per-endpoint queues of responses."""
+
+    def __init__(self, path: str) -> None:
+        self.meta: dict = {}
+        self.http: dict[tuple[str, str], deque] = defaultdict(deque)
+        self.mtproto: dict[str, deque] = defaultdict(deque)
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                if event["kind"] == "meta":
+                    self.meta = self.meta or event
+                elif event["kind"] == "http":
+                    self.http[(event["method"], event["endpoint"])].append(event)
+                elif event["kind"] == "mtproto":
+                    self.mtproto[event["request"]].append(event)
+
+    def poll_gaps(self) -> deque:
+        """Recorded pauses between collection polls (immediate follow-ups skipped)."""
+        gaps = deque()
+        polls = list(self.http.get(("GET", "collection"), ()))
+        for prev, nxt in zip(polls, polls[1:]):
+            gap = nxt["t"] - (prev["t"] + prev["duration"])
+            if gap > MIN_POLL_GAP:
+                gaps.append(gap)
+        return gaps
+
+    def first_collection_id(self) -> int | None:
+        """ID of the first collection the recorded monitor asked for."""
+        polls = self.http.get(("GET", "collection"))
+        if not polls:
+            return None
+        return int(polls[0]["url"].rstrip("/").rsplit("/", 1)[-1])
+
+    def remaining(self) -> int:
+        return sum(map(len, self.http.values())) + sum(map(len, self.mtproto.values()))
+
+
+async def _pause(event: dict, speed: float) -> None:
+    if speed > 0 and event.get("duration"):
+        await asyncio.sleep(event["duration"] / speed)
+
+
+def _restore(text: str) -> str:
+    """Turn JWT placeholders back into decodable (fake) tokens."""
+    return JWT_PLACEHOLDER.sub(lambda m: fake_jwt(int(m.group(1))), text)
+
+
+def _namespace(data):
+    if isinstance(data, dict):
+        return SimpleNamespace(**{k: _namespace(v) for k, v in data.items()})
+    if isinstance(data, list):
+        return [_namespace(v) for v in data]
+    return data
+
+
+class ReplayTransport(StickerDomTransport):
+    """Serves recorded responses in order, per (method, endpoint)."""
+
+    def __init__(self, trace: Trace, speed: float) -> None:
+        # No aiohttp session: nothing leaves the process.
+        self.loop = asyncio.get_running_loop()
+        self.trace = trace
+        self.speed = speed
+        self.replayed = 0
+        self._closed = False
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    async def request(self, method, url, *, endpoint, bearer=None, headers=None, **kwargs):
+        queue = self.trace.http.get((method, endpoint))
+        if not queue:
+            if endpoint == "warm":
+                return HttpResponse(200, "OK", CIMultiDict(), b"")
+            raise TraceExhausted(f"no more recorded {method} {endpoint} responses")
+        event = queue.popleft()
+        await _pause(event, self.speed)
+        self.replayed += 1
+        error = event.get("error")
+        if error:
+            if error["type"] == "TimeoutError":
+                raise asyncio.TimeoutError(error["message"])
+            raise aiohttp.ClientConnectionError(error["message"])
+        return HttpResponse(
+            event["status"], event["reason"], CIMultiDict(event["headers"]),
+            _restore(event["body"]).encode(),
+        )
+
+    async def close(self) -> None:
+        self._closed = True
+
+
+class ReplayClient(FakeTelegramClient):
+    """Fake Telegram client answering raw requests from a trace."""
+
+    def __init__(self, trace: Trace, speed: float) -> None:
+        super().__init__()
+        self.trace = trace
+        self.speed = speed
+        self.replayed = 0
+
+    async def __call__(self, request):
+        name = type(request).__name__
+        queue = self.trace.mtproto.get(name)
+        if not queue:
+            return await super().__call__(request)  # e.g. keep-alive pings
+        event = queue.popleft()
+        await _pause(event, self.speed)
+        self.replayed += 1
+        self.calls.append((time.monotonic(), name, request))
+        if name == "SendStarsFormRequest":
+            self.sent.append((time.monotonic(), request.invoice.slug))
+        error = event.get("error")
+        if error:
+            if error.get("code"):
+                raise rpc_message_to_error(
+                    SimpleNamespace(error_code=error["code"], error_message=error["message"]), request
+                )
+            raise ConnectionError(error["message"])
+        return _namespace(event["response"])
+
+
+class RecordedScheduler(PollScheduler):
+    """Repeats the pauses between polls that the recorded run made."""
+
+    def __init__(self, trace: Trace, speed: float) -> None:
+        self.gaps = trace.poll_gaps()
+        self.speed = speed
+
+    def next_delay(self, status: int | None, headers=None) -> float:
+        gap = self.gaps.popleft() if self.gaps else 0.0
+        return gap / self.speed if self.speed > 0 else 0.0
+
+
+class ScaledScheduler(PollScheduler):
+    """Runs another scheduler's delays *speed* times faster (no delay at speed 0)."""
+
+    def __init__(self, inner: PollScheduler, speed: float) -> None:
+        self.inner = inner
+        self.speed = speed
+
+    def next_delay(self, status: int | None, headers=None) -> float:
+        delay = self.inner.next_delay(status, headers)
+        return delay / self.speed if self.speed > 0 else 0.0
+
+    def record_drop(self, timestamp: float) -> None:
+        self.inner.record_drop(timestamp)
+
+
+async def replay(
+    path: str,
+    speed: float = 1.0,
+    buy: tuple[int, int] | None = None,
+    scheduler: str = "recorded",
+) -> dict:
+    """
+    Feed the trace at *path* through the real monitor and purchase code.
+
+    *scheduler* is ``"recorded"`` to repeat the recorded pauses between
+    polls, or ``"live"`` to let the current poll_scheduler decide (both are
+    divided by *speed*). With *buy* = (collection, character) a single
+    purchase_once() is replayed instead of the monitor.
+    """
+    trace = Trace(path)
+    workdir = Path(tempfile.mkdtemp(prefix="stickers-replay-"))
+    token_manager.TOKEN_TXT = workdir / "bearer_token.txt"
+    token_manager.TOKEN_TXT.write_text(fake_jwt())
+    store = state_store.open_store(str(workdir / "state.db"))
+    # Start where the recorded monitor started.
+    store.set_last_id((trace.first_collection_id() or 1) - 1)
+
+    transport = ReplayTransport(trace, speed)
+    http_transport.set_transport_factory(lambda: transport)
+    client = ReplayClient(trace, speed)
+    tg_session.use_client(client)
+
+    purchases: set[asyncio.Task] = set()
+
+    async def on_found(collection_id: int, detected_at: float) -> None:
+        task = asyncio.create_task(
+            purchase_planner.purchase_collection(collection_id, PURCHASE_COUNT, detected_at)
+        )
+        purchases.add(task)
+        task.add_done_callback(purchases.discard)
+
+    started = time.monotonic()
+    try:
+        if buy:
+            await purchase_once(*buy)
+        else:
+            if scheduler == "recorded":
+                poll_scheduler = RecordedScheduler(trace, speed)
+            else:
+                poll_scheduler = ScaledScheduler(make_scheduler(), speed)
+            await sticker_monitor.monitor(on_found, poll_scheduler)
+    except TraceExhausted as exc:
+        print(f"⏹  Trace exhausted: {exc}")
+    await asyncio.gather(*purchases, return_exceptions=True)
+    elapsed = time.monotonic() - started
+
+    await tg_session.close_client()
+    await http_transport.close_transport()
+    http_transport.set_transport_factory(StickerDomTransport)
+    return {
+        "path": path,
+        "speed": speed,
+        "elapsed": elapsed,
+        "http": transport.replayed,
+        "mtproto": client.replayed,
+        "unused": trace.remaining(),
+        "stages": metrics.summary(),
+    }
+
+
+def report(result: dict) -> None:
+    speed = f"{result['speed']:g}x" if result["speed"] > 0 else "full speed"
+    print(f"--- Replay of {result['path']} at {speed} ---")
+    print(f"wall time              : {result['elapsed']:8.2f} s")
+    print(f"HTTP responses replayed: {result['http']}")
+    print(f"MTProto calls replayed : {result['mtproto']}")
+    print(f"recorded, not requested: {result['unused']}")
+    for (stage, outcome), (count, total) in sorted(result["stages"].items()):
+        print(f"{stage:>14} {outcome:<16}: {count:5d} × {total / count * 1000:8.1f} ms")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay a recorded traffic trace.")
+    parser.add_argument("trace", help="JSONL trace written with --record")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="1 = recorded pace, 10 = ten times faster, 0 = no waiting")
+    parser.add_argument("--scheduler", choices=("recorded", "live"), default="recorded",
+                        help="repeat the recorded poll pauses, or use the current poll scheduler")
+    parser.add_argument("--buy", metavar="COLLECTION[:CHARACTER]",
+                        help="replay a single purchase instead of the monitor")
+    args = parser.parse_args(argv)
+
+    buy = None
+    if args.buy:
+        collection, _, character = args.buy.partition(":")
+        buy = (int(collection), int(character or CHARACTER_ID))
+    report(asyncio.run(replay(args.trace, args.speed, buy, args.scheduler)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+# watchlist.py
+"""
+Отслеживание уже известных коллекций: докупки, старт продаж, появление
+персонажей.
+
+Все отслеживаемые ID живут в одном процессе: очередь с приоритетом
+(heapq) по времени следующей проверки, свой интервал у каждого ID, общий
+лимит запросов в минуту и не больше ``WATCH_CONCURRENCY`` проверок
+одновременно. Проверка — тот же условный GET, что и у монитора (ETag,
+304), поэтому неизменившаяся коллекция почти ничего не стоит. Когда
+payload меняется, изменение печатается; когда коллекция становится
+доступной для покупки, запускается обычный путь покупки.
+
+Список хранится в state.db:
+
+    python stickers.py watch add 12 15 --interval 20
+    python stickers.py watch list
+    python stickers.py watch run
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import random
+import time
+
+import metrics
+from collection_cache import get_collection_cache
+from http_transport import TransportError, close_transport, get_transport
+from notifier import get_notifier
+from params import (
+    COLLECTION_CHARACTERS,
+    POLL_BACKOFF_MAX,
+    POLL_JITTER,
+    PURCHASE_CHARACTERS,
+    WATCH_CONCURRENCY,
+    WATCH_INTERVAL,
+    WATCH_RATE_PER_MINUTE,
+    WATCH_RELOAD_SECONDS,
+)
+from pipeline import prewarm
+from poll_scheduler import BACKOFF_STATUSES, parse_retry_after
+from purchase_planner import character_offers
+from state_store import StateStore, get_store
+from sticker_monitor import is_live, probe, purchase_collection
+from tg_session import close_client
+
+
+class WatchItem:
+    """One watched collection and what was last seen of it."""
+
+    __slots__ = ("collection_id", "interval", "fingerprint", "payload", "purchasable", "failures")
+
+    def __init__(self, collection_id: int, interval: float) -> None:
+        self.collection_id = collection_id
+        self.interval = interval
+        self.fingerprint: str | None = None
+        self.payload: dict | None = None
+        self.purchasable = False
+        self.failures = 0
+
+
+class RateLimiter:
+    """Spaces requests evenly: at most *per_minute* of them per minute."""
+
+    def __init__(self, per_minute: float) -> None:
+        self.spacing = 60 / per_minute
+        self.next_at = 0.0
+        self.paused_until = 0.0
+
+    async def acquire(self) -> None:
+        now = time.monotonic()
+        at = max(now, self.next_at, self.paused_until)
+        self.next_at = at + self.spacing
+        if at > now:
+            await asyncio.sleep(at - now)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every request for *seconds* (the server asked us to back off)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def is_purchasable(collection_id: int, payload: dict | None) -> bool:
+    """Live, and at least one wanted character is not sold out."""
+    if payload is None:
+        return False
+    offers = character_offers(payload)
+    if not offers:
+        return True  # nothing to go by: a live collection is on sale
+    wanted = COLLECTION_CHARACTERS.get(collection_id, PURCHASE_CHARACTERS)
+    return any(c in offers and offers[c].get("left") != 0 for c in wanted)
+
+
+def describe_change(old: dict | None, new: dict | None) -> str:
+    """Short human-readable difference between two collection payloads."""
+    if old is None or new is None:
+        return "now live" if new is not None else "no longer live"
+    before, after = character_offers(old), character_offers(new)
+    changes = []
+    for character_id in sorted(before.keys() | after.keys()):
+        b, a = before.get(character_id, {}), after.get(character_id, {})
+        for key in ("price", "left"):
+            if b.get(key) != a.get(key):
+                changes.append(f"character {character_id} {key} {b.get(key)} → {a.get(key)}")
+    fields = sorted(k for k in old.keys() | new.keys() if k != "characters" and old.get(k) != new.get(k))
+    if fields:
+        changes.append("fields " + ", ".join(fields))
+    return "; ".join(changes) or "payload changed"
+
+
+def _fingerprint(status: int, data) -> str:
+    body = json.dumps(data, sort_keys=True, ensure_ascii=False) if data is not None else ""
+    return hashlib.sha1(f"{status}:{body}".encode()).hexdigest()
+
+
+def _jitter(delay: float) -> float:
+    return delay * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+
+
+class Watchlist:
+    """Checks every watched collection on its own schedule."""
+
+    def __init__(self, on_found, store: StateStore | None = None) -> None:
+        self.on_found = on_found
+        self.store = store or get_store()
+        self.items: dict[int, WatchItem] = {}
+        self.limiter = RateLimiter(WATCH_RATE_PER_MINUTE)
+        self._heap: list[tuple[float, int, WatchItem]] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(WATCH_CONCURRENCY)
+        self._checks: set[asyncio.Task] = set()
+
+    # -- items -------------------------------------------------------------------
+
+    def add(self, collection_id: int, interval: float = WATCH_INTERVAL) -> None:
+        item = self.items.get(collection_id)
+        if item is not None:
+            item.interval = interval
+            return
+        item = self.items[collection_id] = WatchItem(collection_id, interval)
+        # Spread the first checks out instead of sending them all at once.
+        self._schedule(item, random.uniform(0, interval))
+
+    def remove(self, collection_id: int) -> None:
+        # Its heap entry is dropped lazily when it comes up.
+        self.items.pop(collection_id, None)
+
+    def sync(self) -> None:
+        """Match the items to the watchlist table."""
+        watched = self.store.watched()
+        for collection_id in set(self.items) - set(watched):
+            self.remove(collection_id)
+        for collection_id, interval in watched.items():
+            self.add(collection_id, interval)
+        cache = get_collection_cache()
+        cache.max_entries = max(cache.max_entries, 2 * len(self.items))
+
+    def _schedule(self, item: WatchItem, delay: float) -> None:
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), item))
+        self._wakeup.set()
+
+    # -- scheduling ----------------------------------------------------------------
+
+    async def run(self) -> None:
+        self.sync()
+        print(f"👀 Watching {len(self.items)} collection(s)")
+        reload_at = time.monotonic() + WATCH_RELOAD_SECONDS
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= reload_at:
+                    self.sync()
+                    reload_at = now + WATCH_RELOAD_SECONDS
+                wait = reload_at - now
+                if self._heap:
+                    wait = min(wait, self._heap[0][0] - now)
+                if wait > 0:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                _, _, item = heapq.heappop(self._heap)
+                if self.items.get(item.collection_id) is not item:
+                    continue  # removed or replaced meanwhile
+                await self._slots.acquire()
+                await self.limiter.acquire()
+                task = asyncio.create_task(self._check(item))
+                self._checks.add(task)
+                task.add_done_callback(self._check_done)
+        finally:
+            for task in list(self._checks):
+                task.cancel()
+            await asyncio.gather(*self._checks, return_exceptions=True)
+
+    def _check_done(self, task: asyncio.Task) -> None:
+        self._checks.discard(task)
+        self._slots.release()
+
+    async def _check(self, item: WatchItem) -> None:
+        delay = item.interval
+        try:
+            delay = await self._check_once(item)
+        except Exception as exc:
+            # Whatever went wrong (odd payload, state.db, on_found), the item
+            # stays on the watchlist, and its next check starts afresh.
+            item.fingerprint = None
+            item.failures += 1
+            print(f"⚠️  Watch check of collection {item.collection_id} failed: {exc!r}")
+            delay = min(POLL_BACKOFF_MAX, item.interval * 2 ** item.failures)
+        finally:
+            if self.items.get(item.collection_id) is item:
+                self._schedule(item, _jitter(delay))
+
+    async def _check_once(self, item: WatchItem) -> float:
+        """Check *item* once; returns the delay until its next check."""
+        try:
+            response, data = await probe(get_transport(), item.collection_id)
+        except (*TransportError, RuntimeError) as exc:
+            item.failures += 1
+            print(f"⚠️  Watch check of collection {item.collection_id} failed: {exc}")
+            return min(POLL_BACKOFF_MAX, item.interval * 2 ** item.failures)
+        if response.status in BACKOFF_STATUSES:
+            item.failures += 1
+            retry_after = parse_retry_after(response.headers)
+            if retry_after:
+                self.limiter.pause(retry_after)
+            return retry_after or min(POLL_BACKOFF_MAX, item.interval * 2 ** item.failures)
+        item.failures = 0
+        await self._observe(item, response, data)
+        return item.interval
+
+    async def _observe(self, item: WatchItem, response, data) -> None:
+        first_check = item.fingerprint is None
+        if response.not_modified and not first_check:
+            return  # 304: served from the collection cache, nothing changed
+        fingerprint = _fingerprint(response.status, data)
+        if fingerprint == item.fingerprint:
+            return
+        payload = data.get("data") if is_live(response, data) else None
+        if not first_check:
+            print(f"🔄 Collection {item.collection_id} changed: {describe_change(item.payload, payload)}")
+        item.fingerprint = fingerprint
+        item.payload = payload
+
+        purchasable = is_purchasable(item.collection_id, payload)
+        if purchasable and not item.purchasable:
+            print(f"🛒 Watched collection {item.collection_id} is purchasable")
+            if not first_check:
+                # A restock: earlier attempts (sold out, no Stars) must not
+                # stop this one. Already-paid characters stay skipped.
+                self.store.start_round(item.collection_id)
+            await self.on_found(item.collection_id, time.monotonic())
+        item.purchasable = purchasable
+
+
+# ---------------------------------------------------------------------------
+# Standalone mode
+# ---------------------------------------------------------------------------
+
+async def run_watchlist() -> None:
+    """Watch the collections in state.db and buy them when they become available."""
+    await prewarm()
+    purchases: set[asyncio.Task] = set()
+
+    async def on_found(collection_id: int, detected_at: float) -> None:
+        task = asyncio.create_task(purchase_collection(collection_id, detected_at))
+        purchases.add(task)
+        task.add_done_callback(purchases.discard)
+
+    flusher = asyncio.create_task(metrics.flush_loop())
+    notifications = asyncio.create_task(get_notifier().run())
+    try:
+        await Watchlist(on_found).run()
+    finally:
+        for task in (*purchases, flusher):
+            task.cancel()
+        await asyncio.gather(flusher, *purchases, return_exceptions=True)
+        notifications.cancel()
+        await asyncio.gather(notifications, return_exceptions=True)
+        await close_client()
+        await close_transport()
+
+
+def main() -> None:
+    try:
+        asyncio.run(run_watchlist())
+    except KeyboardInterrupt:
+        print("\n--- Watchlist stopped ---")
+
+
+if __name__ == "__main__":
+    main()